@@ -1,39 +1,225 @@
+import copy
+import math
+import operator
+import os
 import sys
-from functools import reduce
-from itertools import starmap
-from random import choice, randint, random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import reduce, wraps
+from itertools import islice, starmap
+from random import choice, randint, random, seed
 from typing import Dict, List, Set, Tuple
 
 import numpy as np
-from pulp import LpMinimize, LpProblem, LpStatus, LpVariable
+from pulp import (
+    PULP_CBC_CMD,
+    LpMinimize,
+    LpProblem,
+    LpStatus,
+    LpVariable,
+    lpSum,
+)
 from sklearn import tree
 
-from FormulaGenerator import PredicateGenerator
+from FormulaGenerator import (
+    PredicateGenerator,
+    best_predicate,
+    candidate_predicates,
+    encode_inputs,
+)
 from graph import Edge, Node
 from MutationFuzzer import Mutator
+from Predicate import And, Length, Not, Or, Unary
+from Stats import NULL_STATS
+
+_worker_state = threading.local()
+
+
+def _init_worker_runner(runner):
+    _worker_state.runner = copy.copy(runner)
+
+
+def _trace_input(inp):
+    _worker_state.runner.run(inp)
+    return _worker_state.runner.trace()
+
+
+def _timed(name):
+    # Times every call of a `ControlFlowModel` method in its `stats`
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.stats.timer(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _init_condition_worker(pools):
+    # A model without record and runner is enough to estimate predicates
+    _worker_state.model = ControlFlowModel({}, None, None, None)
+    _worker_state.pools = pools
+
+
+def _estimate_condition(job):
+    return _worker_state.model.estimate_condition(_worker_state.pools, *job)
+
+
+class ContextMapLP:
+    """The LP of `ControlFlowModel.optimize_context_map`, kept in memory.
+
+    Each call context has a lower and an upper bound variable. The
+    variables, and the constraints of a call stack, are kept across
+    solves; the constraints are only rebuilt when its essential indices
+    change. The problem itself is assembled from them on every solve,
+    and CBC solves it from scratch.
+    """
+
+    def __init__(self) -> None:
+        # call context -> (lower bound, upper bound)
+        self.range_vars = {}
+        # call stack -> (essential indices, constraints)
+        self.stack_constraints = {}
+
+    def stack_constraint_list(self, call_stack, essential_idx):
+        if len(essential_idx) == 0:
+            return []
+        min_range = max(essential_idx) - min(essential_idx) + 1
+        base_lb, base_ub = self.range_vars[call_stack[0]]
+        offset = lpSum(
+            self.range_vars[call_context][0]
+            for call_context in call_stack[:-1]
+        )
+        last_lb, last_ub = self.range_vars[call_stack[-1]]
+        return [
+            base_ub - base_lb >= min_range,
+            offset + last_lb <= min(essential_idx),
+            offset + last_ub >= max(essential_idx) + 1,
+        ]
+
+    def solve(self, callstack_essential_idx, upbound):
+        contexts = {
+            call_context
+            for call_stack in callstack_essential_idx
+            for call_context in call_stack
+        }
+        if not contexts:
+            return {}
+        for call_context in contexts:
+            if call_context not in self.range_vars:
+                self.range_vars[call_context] = (
+                    LpVariable(f"{call_context}-lb", 0, upbound),
+                    LpVariable(f"{call_context}-ub", 0, upbound),
+                )
+            for var in self.range_vars[call_context]:
+                var.upBound = upbound
+        prob = LpProblem("context_map", LpMinimize)
+        prob += lpSum(
+            self.range_vars[call_context][1] - self.range_vars[call_context][0]
+            for call_context in contexts
+        )
+        for call_context in contexts:
+            lbvar, ubvar = self.range_vars[call_context]
+            prob += lbvar <= ubvar
+        for call_stack, essential_idx in callstack_essential_idx.items():
+            cached = self.stack_constraints.get(call_stack)
+            if cached is None or cached[0] != essential_idx:
+                cached = (
+                    set(essential_idx),
+                    self.stack_constraint_list(call_stack, essential_idx),
+                )
+                self.stack_constraints[call_stack] = cached
+            for constraint in cached[1]:
+                prob += constraint
+        prob.solve(PULP_CBC_CMD(msg=False))
+        return {
+            call_context: range(
+                round(self.range_vars[call_context][0].varValue or 0),
+                round(self.range_vars[call_context][1].varValue or 0),
+            )
+            for call_context in contexts
+        }
 
 
 class ControlFlowModel:
+    # A `Stats.Stats` to instrument modeling with
+    stats = NULL_STATS
+
     def __init__(self, record, contcov_graph, coverage_graph, runner):
         self._record = record
         self._contcov_graph = contcov_graph
         self._coverage_graph = coverage_graph
         self._runner = runner
+        # edge -> (`Predicate.Predicate`, confidence)
         self._edge_condition = {}
+        self._context_map = {}
+        # Streaming state for `update_condition`
+        self._edge_pools = {}
         self._bnodes = None
         self._mutator = Mutator()
         self._formula_generator = PredicateGenerator()
+        self._context_lp = ContextMapLP()
+        # Candidate predicates scored by `calc_fitness_batch` and
+        # `synthesize_predicate`
+        self._fitness_evaluations = 0
+        # contcov label -> ids of the recorded paths covering it
+        self._record_paths = []
+        self._label_postings = {}
+        # contcov label -> (covering inputs, inputs in context)
+        self._input_in_context_cache = {}
+        # coverage label -> contcov nodes of it, and the contcov labels of
+        # the branch nodes; built on first use, kept up by `on_record` and
+        # dropped when the graphs are replaced or rescanned
+        self._context_node_index = None
+        self._context_bnode_labels = None
 
     def set_context_map(self, context_map):
         self._context_map = context_map
+        self._input_in_context_cache = {}
+
+    def set_graphs(self, contcov_graph, coverage_graph) -> None:
+        self._contcov_graph = contcov_graph
+        self._coverage_graph = coverage_graph
+        self._bnodes = None
+        self._context_node_index = None
+        self._context_bnode_labels = None
+
+    def index_record(self) -> None:
+        # The recorder only appends paths, so index the new ones
+        if len(self._record) == len(self._record_paths):
+            return
+        for path in islice(self._record, len(self._record_paths), None):
+            path_id = len(self._record_paths)
+            self._record_paths.append(path)
+            for label in path:
+                if label not in self._label_postings:
+                    self._label_postings[label] = set()
+                self._label_postings[label].add(path_id)
+                self._input_in_context_cache.pop(label, None)
 
     def identify_branch(self) -> None:
+        # The graphs may have changed outside of `on_record`
         self._bnodes = []
+        self._context_node_index = None
+        self._context_bnode_labels = None
         for node in self._coverage_graph:
             if node.num_child() > 1:
                 self._bnodes.append(node)
         print("branches:", self._bnodes)
 
+    def branch_nodes(self):
+        # `identify_branch` without the report, for the streaming paths
+        # that find the branches again after every `on_record`
+        if self._bnodes is None:
+            self._bnodes = [
+                node for node in self._coverage_graph if node.num_child() > 1
+            ]
+            self._context_bnode_labels = None
+        return self._bnodes
+
     def identify_call_context(self) -> None:
         self._call_contexts = set()
         for path, _ in self._record.items():
@@ -45,16 +231,32 @@ class ControlFlowModel:
         print("call contexts:", self._call_contexts)
 
     def mutate_input(self, inp, idx) -> str:
-        # sourcery skip: use-assigned-variable
-        random_chr = inp[idx]
-        while random_chr == inp[idx]:
-            random_chr = self._mutator.generate_random_character()
+        random_chr = self._mutator.generate_other_character(inp[idx])
         return inp[:idx] + random_chr + inp[idx + 1 :]
 
     def get_path(self, inp):
         self._runner.run(inp)
         return self._runner.trace()
 
+    def get_paths(self, inps, executor=None):
+        if executor is None:
+            for inp in inps:
+                yield self.get_path(inp)
+            return
+        chunksize = max(1, len(inps) // 64)
+        yield from executor.map(_trace_input, inps, chunksize=chunksize)
+
+    def make_executor(self, workers, use_threads=False):
+        if not workers:
+            return None
+        # Every worker traces with its own copy of the runner
+        executor_class = (
+            ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+        )
+        return executor_class(
+            workers, initializer=_init_worker_runner, initargs=(self._runner,)
+        )
+
     def get_contcov_bnode_coverage(self, path, context_bnode_labels):
         contcov_bnodes = {
             contcov: set()
@@ -66,76 +268,192 @@ class ControlFlowModel:
                 contcov_bnodes[contcov].add(path[idx + 1])
         return contcov_bnodes
 
+    def index_context_nodes(self, context_nodes) -> None:
+        for context_node in context_nodes:
+            coverage_label = context_node.label[1]
+            if coverage_label not in self._context_node_index:
+                self._context_node_index[coverage_label] = set()
+            self._context_node_index[coverage_label].add(context_node)
+
     def get_context_nodes(self, coverage_node) -> Set[Node]:
-        return {
-            context_node
-            for context_node in self._contcov_graph
-            if coverage_node.label == context_node.label[1]
-        }
+        # The returned set is shared with the index; do not modify it
+        if self._context_node_index is None:
+            self._context_node_index = {}
+            self.index_context_nodes(self._contcov_graph)
+        return self._context_node_index.get(coverage_node.label, set())
 
     def get_context_bnode_labels(self):
-        context_bnodes = reduce(
-            set.union, [self.get_context_nodes(bnode) for bnode in self._bnodes]
-        )
-        return {bnode.label for bnode in context_bnodes}
+        if self._context_bnode_labels is None:
+            context_bnodes = reduce(
+                set.union,
+                [self.get_context_nodes(bnode) for bnode in self._bnodes],
+            )
+            self._context_bnode_labels = {
+                bnode.label for bnode in context_bnodes
+            }
+        return self._context_bnode_labels
 
     def optimize_context_map(self, callstack_essential_idx):
+        """Fit an input range to every call context.
+
+        The ranges along a call stack, each offset by the starts of the
+        outer ones, must cover the essential indices of the stack, and
+        their total width is minimized. A context appearing in no call
+        stack but its own does not interact with the others and just
+        covers its essential indices; only the remaining stacks go to the
+        LP kept in `self._context_lp`.
+        """
         if len(callstack_essential_idx) == 0:
             return {}
-        lowbound, upbound = (
-            0,
-            max(reduce(set.union, callstack_essential_idx.values())) + 1,
+        upbound = (
+            max(reduce(set.union, callstack_essential_idx.values()), default=0)
+            + 1
         )
-        range_var_map = {}
-        for call_stack, _ in callstack_essential_idx.items():
-            for call_context in call_stack:
-                if call_context not in range_var_map:
-                    lbvar = LpVariable(
-                        "-".join([call_context, "lb"]), lowbound, upbound
-                    )
-                    ubvar = LpVariable(
-                        "-".join([call_context, "ub"]), lowbound, upbound
+        nested = {
+            call_context
+            for call_stack in callstack_essential_idx
+            if len(call_stack) > 1
+            for call_context in call_stack
+        }
+        context_map, lp_stacks = {}, {}
+        for call_stack, essential_idx in callstack_essential_idx.items():
+            if len(call_stack) == 1 and call_stack[0] not in nested:
+                if len(essential_idx) > 0:
+                    context_map[call_stack[0]] = range(
+                        min(essential_idx), max(essential_idx) + 1
                     )
-                    range_var_map[call_context] = (lbvar, ubvar)
-        # print(range_var_map)
-        prob = LpProblem("context map prob", LpMinimize)
+                else:
+                    context_map[call_stack[0]] = range(0, 0)
+            else:
+                lp_stacks[call_stack] = essential_idx
+        with self.stats.timer("context_map.solve"):
+            context_map.update(self._context_lp.solve(lp_stacks, upbound))
+        return context_map
 
-        # Minimize equation
-        opt_equ = sum(
-            ubvar - lbvar for _, (lbvar, ubvar) in range_var_map.items()
+    def update_essential_idx(
+        self,
+        context_bnode_essential_idx,
+        contcov_bnodes,
+        context_bnode_labels,
+        idx,
+        new_path,
+    ) -> None:
+        new_contcov_bnodes = self.get_contcov_bnode_coverage(
+            new_path, context_bnode_labels
         )
-        prob += opt_equ
+        for bnode_label, child_label_set in contcov_bnodes.items():
+            if bnode_label not in new_contcov_bnodes:
+                continue
+            elif child_label_set != new_contcov_bnodes[bnode_label]:
+                context_bnode_essential_idx[bnode_label].add(idx)
+        return new_contcov_bnodes
 
-        # Constraints
-        for _, (lbvar, ubvar) in range_var_map.items():
-            prob += lbvar <= ubvar
+    def probe_input(
+        self,
+        inp,
+        contcov_bnodes,
+        context_bnode_labels,
+        context_bnode_essential_idx,
+        mut_trial,
+        early_exit=False,
+        executor=None,
+        settle_trials=math.inf,
+        observed=None,
+    ) -> None:
+        # `observed` maps (branch node, index) to the mutants of the index
+        # that reached the branch node, over all probed inputs
+        if observed is None:
+            observed = {}
+        adaptive = early_exit or settle_trials < math.inf
 
-        for call_stack, essential_idx in callstack_essential_idx.items():
-            if len(call_stack) > 0 and len(essential_idx) > 0:
-                min_range = max(essential_idx) - min(essential_idx) + 1
-                base_lb, base_ub = range_var_map[call_stack[0]]
-                prob += (base_ub - base_lb) >= min_range
-
-                opt_lb, opt_ub = 0, 0
-                last_lb, last_ub = range_var_map[call_stack[-1]]
-                for call_context in call_stack[:-1]:
-                    lbvar, ubvar = range_var_map[call_context]
-                    opt_lb += lbvar
-                    opt_ub += lbvar
-                opt_lb += last_lb
-                opt_ub += last_ub
-                prob += opt_lb <= min(essential_idx)
-                prob += opt_ub >= max(essential_idx) + 1
-        prob.writeLP("contextMapProb.lp")
-        # todo: Remove output
-        prob.solve()
-        return {
-            call_stack: range(int(lbvar.varValue), int(ubvar.varValue))
-            for call_stack, (lbvar, ubvar) in range_var_map.items()
-        }
+        def is_settled(idx):
+            return all(
+                idx in context_bnode_essential_idx[bnode_label]
+                or observed.get((bnode_label, idx), 0) >= settle_trials
+                for bnode_label in contcov_bnodes
+            )
 
-    def model_context(self, inp_sample_size=1, mut_trial=1) -> None:
-        self._context_map = {}
+        if adaptive:
+            # Mutate every open index once per round, and close an index
+            # once it is essential for all branch nodes on the path, or is
+            # not for the rest of them after `settle_trials` mutants
+            # reaching each. Mutants that skip a branch node tell nothing
+            # about it, so indices that often divert the path are probed
+            # longer, up to `mut_trial`.
+            open_idx = [idx for idx in range(len(inp)) if not is_settled(idx)]
+            rounds = [open_idx] * mut_trial
+        else:
+            rounds = [
+                [idx for idx in range(len(inp)) for _ in range(mut_trial)]
+            ]
+        for round_idx in rounds:
+            if adaptive:
+                round_idx = [idx for idx in round_idx if not is_settled(idx)]
+                if not round_idx:
+                    break
+            mutants = [self.mutate_input(inp, idx) for idx in round_idx]
+            for idx, new_path in zip(
+                round_idx, self.get_paths(mutants, executor)
+            ):
+                if self.stats.enabled:
+                    self.stats.count("model_context.executions")
+                    self.stats.count("trace_events", len(new_path))
+                    self.stats.count("mutants", key=idx)
+                    self.stats.tick()
+                new_contcov_bnodes = self.update_essential_idx(
+                    context_bnode_essential_idx,
+                    contcov_bnodes,
+                    context_bnode_labels,
+                    idx,
+                    new_path,
+                )
+                for bnode_label in contcov_bnodes:
+                    if bnode_label in new_contcov_bnodes:
+                        key = (bnode_label, idx)
+                        observed[key] = observed.get(key, 0) + 1
+
+    @_timed("model_context")
+    def model_context(
+        self,
+        inp_sample_size=1,
+        mut_trial=1,
+        workers=0,
+        use_threads=False,
+        early_exit=False,
+        confidence=None,
+        min_effect=0.2,
+    ) -> None:
+        """Fit the context map by mutating sampled inputs of each path.
+
+        Every index of up to `inp_sample_size` inputs per path is mutated
+        `mut_trial` times, and is essential for a branch node if a mutant
+        changes the children taken at it. With `early_exit`, an index is
+        no longer mutated once it is essential for every branch node on
+        the path.
+
+        With `confidence`, probing is adaptive: an index is also no longer
+        mutated for a branch node once enough of its mutants, over all
+        inputs, reached the node without changing it. That rules out at
+        the given confidence that the index changes the node in at least
+        a `min_effect` share of such mutants (an exact one-sided bound for
+        zero successes). `mut_trial` then caps the mutants of an index
+        per input. Both `confidence` and `min_effect` must lie strictly
+        between 0 and 1.
+        """
+        settle_trials = math.inf
+        if confidence is not None:
+            if not 0 < confidence < 1:
+                raise ValueError(
+                    f"confidence must be in (0, 1), got {confidence!r}"
+                )
+            if not 0 < min_effect < 1:
+                raise ValueError(
+                    f"min_effect must be in (0, 1), got {min_effect!r}"
+                )
+            settle_trials = math.ceil(
+                math.log(1 - confidence) / math.log(1 - min_effect)
+            )
+        self.set_context_map({})
         # set difference로 차이를 보면, 서로 다른 context에서 cover가 되었을 때, 영향을 미치는 것이 맞지만, 이를 파악하지 못 할 수 있다.
         # 처음 바뀐 부분으로 차이를 보면, mutate 된 부분이 여러 곳에 영향을 미치는 것을 파악하지 못 할 수 있다.
         # 우선은 set difference로 가자.
@@ -143,37 +461,35 @@ class ControlFlowModel:
         context_bnode_essential_idx = {
             bnode_label: set() for bnode_label in context_bnode_labels
         }
-        for path, inputs in self._record.items():
-            # print(f"[D] Analyze {path=}")
-            contcov_bnodes = self.get_contcov_bnode_coverage(
-                path, context_bnode_labels
-            )
-            inp_samples = np.random.choice(
-                list(inputs), min(inp_sample_size, len(inputs)), replace=False
-            )
-            for inp in inp_samples:
-                # print(f"[D] Sample input: {inp}")
-                for idx in range(len(inp)):
-                    for _ in range(mut_trial):
-                        new_inp = self.mutate_input(inp, idx)
-                        # print(f"[D]    New input: {new_inp}")
-                        new_path = self.get_path(new_inp)
-                        new_contcov_bnodes = self.get_contcov_bnode_coverage(
-                            new_path, context_bnode_labels
-                        )
-                        for (
-                            bnode_label,
-                            child_label_set,
-                        ) in contcov_bnodes.items():
-                            if bnode_label not in new_contcov_bnodes:
-                                continue
-                            elif (
-                                child_label_set
-                                != new_contcov_bnodes[bnode_label]
-                            ):
-                                context_bnode_essential_idx[bnode_label].add(
-                                    idx
-                                )
+        executor = self.make_executor(workers, use_threads)
+        observed = {}
+        try:
+            for path, inputs in self._record.items():
+                # print(f"[D] Analyze {path=}")
+                contcov_bnodes = self.get_contcov_bnode_coverage(
+                    path, context_bnode_labels
+                )
+                inp_samples = np.random.choice(
+                    list(inputs),
+                    min(inp_sample_size, len(inputs)),
+                    replace=False,
+                )
+                for inp in inp_samples:
+                    # print(f"[D] Sample input: {inp}")
+                    self.probe_input(
+                        inp,
+                        contcov_bnodes,
+                        context_bnode_labels,
+                        context_bnode_essential_idx,
+                        mut_trial,
+                        early_exit,
+                        executor,
+                        settle_trials,
+                        observed,
+                    )
+        finally:
+            if executor is not None:
+                executor.shutdown()
         callstack_essential_idx = {}
         for k, v in context_bnode_essential_idx.items():
             if k[0] == "":
@@ -186,19 +502,37 @@ class ControlFlowModel:
             ].union(v)
         # for k, v in callstack_essential_idx.items():
         #     print(f"[D, callstack_essential_idx] {k=} {v=}")
-        self._context_map = self.optimize_context_map(callstack_essential_idx)
+        self.set_context_map(
+            self.optimize_context_map(callstack_essential_idx)
+        )
         for k, v in self._context_map.items():
             print(f"[context_map] {k=} {v=}")
 
     def get_input(self, contcov_node) -> Set[str]:
+        self.index_record()
         covering_inputs = set()
-        for path, inputs in self._record.items():
-            if contcov_node.label in path:
-                covering_inputs = covering_inputs.union(inputs)
+        for path_id in self._label_postings.get(contcov_node.label, ()):
+            covering_inputs.update(self._record[self._record_paths[path_id]])
         return covering_inputs
 
     def get_input_in_context(self, contcov_node) -> Set[str]:
+        # Cached with the covering inputs it was computed from, so that a
+        # changed input set of a recorded path invalidates it as well
         covering_inputs = self.get_input(contcov_node)
+        cached = self._input_in_context_cache.get(contcov_node.label)
+        if cached is None or cached[0] != covering_inputs:
+            cached = (
+                covering_inputs,
+                self.compute_input_in_context(contcov_node, covering_inputs),
+            )
+            self._input_in_context_cache[contcov_node.label] = cached
+        return cached[1]
+
+    def compute_input_in_context(
+        self, contcov_node, covering_inputs=None
+    ) -> Set[str]:
+        if covering_inputs is None:
+            covering_inputs = self.get_input(contcov_node)
         call_stack = contcov_node.label[0].split("-")
         inputs_in_context = set()
         for inp in covering_inputs:
@@ -229,83 +563,429 @@ class ControlFlowModel:
             fitness += int(not formula(inp)) * 2 - 1
         return fitness
 
-    def estimate_predicate(self, accepts: List, rejects: List, max_trial=100):
+    def encode_pool(self, accepts, rejects):
+        matrix, lengths = encode_inputs(accepts + rejects)
+        signs = np.ones(len(accepts) + len(rejects), dtype=np.int64)
+        signs[len(accepts) :] = -1
+        return matrix, lengths, signs
+
+    def calc_fitness_batch(self, predicates, pool) -> np.ndarray:
+        # An input scores +1 if the predicate agrees with its pool, else -1
+        matrix, lengths, signs = pool
+        self._fitness_evaluations += len(predicates)
+        hits = np.column_stack(
+            [predicate.evaluate(matrix, lengths) for predicate in predicates]
+        )
+        return 2 * (signs @ hits) - signs.sum()
+
+    def estimate_predicate(
+        self,
+        accepts: List,
+        rejects: List,
+        max_trial=100,
+        batch_size=1,
+        pool=None,
+    ):
         input_size = len(accepts + rejects)
-        gb_fitness, gb_formula, gb_formula_str = -sys.maxsize, None, None
+        if pool is None:
+            pool = self.encode_pool(accepts, rejects)
+        gb_fitness, gb_predicate = -sys.maxsize, None
         trial = 0
-        while trial < max_trial:
-            try:
-                if random() >= 0.5:
-                    sample = choice(accepts)
-                    formula, formula_str = self._formula_generator.generate(
-                        sample, True
-                    )
-                else:
-                    sample = choice(rejects)
-                    formula, formula_str = self._formula_generator.generate(
-                        sample, False
-                    )
-            except IndexError as _:
+        while trial < max_trial and gb_fitness < input_size:
+            candidates = []
+            while len(candidates) < min(batch_size, max_trial - trial):
+                try:
+                    if random() >= 0.5:
+                        sample = choice(accepts)
+                        candidates.append(
+                            self._formula_generator.generate(sample, True)
+                        )
+                    else:
+                        sample = choice(rejects)
+                        candidates.append(
+                            self._formula_generator.generate(sample, False)
+                        )
+                except IndexError as _:
+                    continue
+
+            fitnesses = self.calc_fitness_batch(candidates, pool)
+            for predicate, fitness in zip(candidates, fitnesses.tolist()):
+                if fitness > gb_fitness:
+                    gb_predicate, gb_fitness = predicate, fitness
+                if fitness == input_size:
+                    break
+                trial += 1
+        return gb_predicate, gb_fitness / input_size, trial, max_trial
+
+    def fit_tree_predicate(self, pool, max_depth=3):
+        """A predicate read off a decision tree fitted to an encoded pool.
+
+        The tree splits on the code point at each position (-1 past the
+        end), on the length, and on the best candidate of each kind and
+        position (`candidate_predicates`). The predicate is the
+        disjunction of the paths to accepting leaves, each a conjunction
+        of its splits, so it covers conditions no single predicate
+        expresses. Returns None if the tree accepts nothing.
+        """
+        matrix, lengths, signs = pool
+        width = matrix.shape[1]
+        feature_predicates = [
+            predicate
+            for _, predicate, _ in candidate_predicates(matrix, lengths, signs)
+        ]
+        features = np.column_stack(
+            [matrix, lengths]
+            + [
+                predicate.evaluate(matrix, lengths)
+                for predicate in feature_predicates
+            ]
+        )
+        classifier = tree.DecisionTreeClassifier(
+            max_depth=max_depth, random_state=0
+        ).fit(features, signs > 0)
+        if True not in classifier.classes_:
+            return None
+        accept = list(classifier.classes_).index(True)
+        structure = classifier.tree_
+
+        def split(node, left):
+            feature = int(structure.feature[node])
+            if feature > width:
+                predicate = feature_predicates[feature - width - 1]
+                return Not(predicate) if left else predicate
+            # Features are integers, so `x <= t` is `x <= floor(t)`
+            value = int(np.floor(structure.threshold[node]))
+            if feature == width:
+                return Length(operator.le if left else operator.gt, value)
+            if value < 0:
+                # Splits off the inputs too short to have the position
+                return Length(operator.le if left else operator.gt, feature)
+            predicate = Unary(feature, operator.gt, chr(value))
+            return Not(predicate) if left else predicate
+
+        paths = []
+        stack = [(0, ())]
+        while stack:
+            node, conditions = stack.pop()
+            left = structure.children_left[node]
+            if left == tree._tree.TREE_LEAF:
+                if conditions and np.argmax(structure.value[node]) == accept:
+                    paths.append(conditions)
                 continue
+            right = structure.children_right[node]
+            stack.append((right, conditions + (split(node, False),)))
+            stack.append((left, conditions + (split(node, True),)))
+        if not paths:
+            return None
+        conjunctions = [
+            path[0] if len(path) == 1 else And(path) for path in paths
+        ]
+        if len(conjunctions) == 1:
+            return conjunctions[0]
+        return Or(conjunctions)
 
-            fitness = self.calc_fitness(formula, accepts, rejects)
-            if fitness > gb_fitness:
-                gb_formula, gb_formula_str, gb_fitness = (
-                    formula,
-                    formula_str,
-                    fitness,
+    def synthesize_predicate(
+        self, accepts: List, rejects: List, max_depth=3, pool=None
+    ):
+        """Deterministic alternative to `estimate_predicate`.
+
+        Scores every candidate of `best_predicate` on the pools, which
+        hold the inputs in context, so positions are relative to the
+        context. If the best one does not separate the pools, a decision
+        tree of depth `max_depth` is tried (`fit_tree_predicate`) and kept
+        if it does better.
+        Returns the same tuple as `estimate_predicate`, with the number of
+        scored candidates as both trial counts. A given `pool` is used
+        as is, so its row order decides ties of the tree.
+        """
+        input_size = len(accepts) + len(rejects)
+        if pool is None:
+            pool = self.encode_pool(sorted(accepts), sorted(rejects))
+        predicate, num_candidates = best_predicate(*pool)
+        self._fitness_evaluations += num_candidates
+        fitness = int(self.calc_fitness_batch([predicate], pool)[0])
+        if fitness < input_size and max_depth:
+            tree_predicate = self.fit_tree_predicate(pool, max_depth)
+            if tree_predicate is not None:
+                tree_fitness = int(
+                    self.calc_fitness_batch([tree_predicate], pool)[0]
                 )
-            if fitness == input_size:
-                break
-            trial += 1
+                if tree_fitness > fitness:
+                    predicate, fitness = tree_predicate, tree_fitness
         return (
-            gb_formula,
-            gb_formula_str,
-            gb_fitness / input_size,
-            trial,
-            max_trial,
+            predicate,
+            fitness / input_size,
+            num_candidates,
+            num_candidates,
+        )
+
+    def get_edge_pools(self, node):
+        context_nodes = self.get_context_nodes(node)
+        pool = reduce(
+            set.union,
+            [self.get_input_in_context(node) for node in context_nodes],
         )
+        for child in node:
+            context_child = self.get_context_nodes(child)
+            accepts = reduce(
+                set.union,
+                [self.get_input_in_context(node) for node in context_child],
+            ).intersection(pool)
+            rejects = pool - accepts
+            yield child, accepts, rejects
+
+    def predict_condition(self, accepts, rejects, max_trial, exact):
+        if exact:
+            return self.synthesize_predicate(list(accepts), list(rejects))
+        return self.estimate_predicate(list(accepts), list(rejects), max_trial)
+
+    def estimate_condition(
+        self, pools, pool_index, accepted, max_trial, exact, job_seed=None
+    ):
+        """Estimate the predicate of one edge on a shared encoded pool.
 
-    def model_condition(self, max_trial=100) -> None:
+        `pools[pool_index]` holds the inputs of a branch node with their
+        `encode_inputs` matrix and lengths; `accepted` marks the inputs
+        taking the edge. The RNGs are seeded with `job_seed` if given.
+        Returns the estimate followed by the number of fitness
+        evaluations, and the start time, duration and process of the job.
+        """
+        start = time.perf_counter()
+        evaluations = self._fitness_evaluations
+        if job_seed is not None:
+            seed(job_seed)
+            np.random.seed(job_seed)
+        inputs, matrix, lengths = pools[pool_index]
+        pool = (matrix, lengths, np.where(accepted, 1, -1))
+        accepts = [inp for inp, taken in zip(inputs, accepted) if taken]
+        rejects = [inp for inp, taken in zip(inputs, accepted) if not taken]
+        if exact:
+            estimate = self.synthesize_predicate(accepts, rejects, pool=pool)
+        else:
+            estimate = self.estimate_predicate(
+                accepts, rejects, max_trial, pool=pool
+            )
+        evaluations = self._fitness_evaluations - evaluations
+        seconds = time.perf_counter() - start
+        return estimate + (evaluations, start, seconds, os.getpid())
+
+    @_timed("model_condition")
+    def model_condition(self, max_trial=100, exact=False, workers=0) -> None:
+        """Estimate the condition of every branch edge.
+
+        With `exact`, predicates are synthesized deterministically by
+        `synthesize_predicate` instead of by random trials. The edges of a
+        branch node share one encoded pool. With `workers`, the edges are
+        estimated in a process pool, largest pools first; every job seeds
+        its RNGs from the current ones, so results do not depend on the
+        order in which jobs finish.
+        """
         if self._bnodes is None:
             self.identify_branch()
+        pools, edges, jobs = [], [], []
         for node in self._bnodes:
-            context_nodes = self.get_context_nodes(node)
-            pool = reduce(
-                set.union,
-                [self.get_input_in_context(node) for node in context_nodes],
+            pool_index = None
+            for child, accepts, rejects in self.get_edge_pools(node):
+                edges.append(Edge(node, child))
+                if not (len(accepts) and len(rejects)):
+                    jobs.append(None)
+                    continue
+                if pool_index is None:
+                    inputs = sorted(accepts | rejects)
+                    pools.append((inputs, *encode_inputs(inputs)))
+                    pool_index = len(pools) - 1
+                inputs = pools[pool_index][0]
+                accepted = np.fromiter(
+                    (inp in accepts for inp in inputs), bool, len(inputs)
+                )
+                jobs.append((pool_index, accepted, max_trial, exact))
+
+        results = [None] * len(jobs)
+        if workers:
+            indices = [idx for idx, job in enumerate(jobs) if job is not None]
+            job_seeds = {idx: randint(0, 2**32 - 1) for idx in indices}
+            indices.sort(key=lambda idx: -len(pools[jobs[idx][0]][0]))
+            with ProcessPoolExecutor(
+                workers,
+                initializer=_init_condition_worker,
+                initargs=(pools,),
+            ) as executor:
+                futures = {
+                    idx: executor.submit(
+                        _estimate_condition, jobs[idx] + (job_seeds[idx],)
+                    )
+                    for idx in indices
+                }
+                for idx, future in futures.items():
+                    results[idx] = future.result()
+        else:
+            for idx, job in enumerate(jobs):
+                if job is not None:
+                    results[idx] = self.estimate_condition(pools, *job)
+
+        for edge, result in zip(edges, results):
+            print(f"Modeling {edge.src} -> {edge.dest}...", end=" ")
+            if result is None:
+                self._edge_condition[edge] = (None, None)
+                print("No accepts or rejects; skip.")
+                continue
+            predicate, conf, trial, trials, *job_stats = result
+            if self.stats.enabled:
+                evaluations, start, seconds, pid = job_stats
+                self.stats.count("predicate_trials", trial, key=str(edge))
+                self.stats.count(
+                    "fitness_evaluations", evaluations, key=str(edge)
+                )
+                self.stats.add_time(
+                    "model_condition.edge", seconds, start, tid=pid
+                )
+            self._edge_condition[edge] = (predicate, conf)
+            print(
+                f"formula: <{predicate}> (conf: {conf}, trial: ({trial} / {trials}))"
+            )
+
+    def on_record(self, path, inp) -> None:
+        # Recorder callback: `inp` was added to the inputs of `path`
+        self._contcov_graph.accept(path)
+        self._coverage_graph.accept([contcov[1] for contcov in path])
+        self._bnodes = None
+        self._context_bnode_labels = None
+        if self._context_node_index is not None:
+            self.index_context_nodes(
+                self._contcov_graph.find_node(label) for label in path
             )
+        self.index_record()
+        for label in path:
+            self._input_in_context_cache.pop(label, None)
+
+    def update_condition(self, max_trial=100, exact=False) -> List[Edge]:
+        """Re-estimate the edges whose accept/reject pools changed.
+
+        The best formula seen so far is kept for each edge: the previous
+        one is re-scored on the new pools and replaced only if the new
+        estimate is better. `exact` is as for `model_condition`. Returns
+        the re-estimated edges.
+        """
+        updated = []
+        for node in self.branch_nodes():
+            # The changed edges of a node share one encoded pool
+            pools = []
+            for child, accepts, rejects in self.get_edge_pools(node):
+                edge = Edge(node, child)
+                # Fresh sets, so they can be kept for the next comparison
+                if self._edge_pools.get(edge) == (accepts, rejects):
+                    continue
+                self._edge_pools[edge] = (accepts, rejects)
+                updated.append(edge)
+                if not (len(accepts) and len(rejects)):
+                    self._edge_condition[edge] = (None, None)
+                    continue
+                if not pools:
+                    inputs = sorted(accepts | rejects)
+                    pools.append((inputs, *encode_inputs(inputs)))
+                inputs, matrix, lengths = pools[0]
+                accepted = np.fromiter(
+                    (inp in accepts for inp in inputs), bool, len(inputs)
+                )
+                predicate, conf, *_ = self.estimate_condition(
+                    pools, 0, accepted, max_trial, exact
+                )
+                old_predicate, _ = self._edge_condition.get(edge, (None, None))
+                if old_predicate is not None:
+                    pool = (matrix, lengths, np.where(accepted, 1, -1))
+                    fitness = self.calc_fitness_batch([old_predicate], pool)
+                    old_conf = int(fitness[0]) / len(inputs)
+                    if old_conf >= conf:
+                        predicate, conf = old_predicate, old_conf
+                self._edge_condition[edge] = (predicate, conf)
+                print(f"Updated {edge}: <{predicate}> (conf: {conf})")
+        return updated
+
+    def context_offset(self, call_stack) -> int:
+        # Start of the input in context `call_stack`, as in
+        # `compute_input_in_context`
+        offset = 0
+        for call_context in call_stack.split("-"):
+            map_func = self._context_map.get(call_context, ())
+            if len(map_func) > 0:
+                offset += min(map_func)
+        return offset
+
+    def context_range(self, call_stack):
+        # Input range read by the innermost context of `call_stack`
+        *outer, call_context = call_stack.split("-")
+        map_func = self._context_map.get(call_context, ())
+        if len(map_func) == 0:
+            return None
+        offset = self.context_offset("-".join(outer))
+        return range(offset + min(map_func), offset + max(map_func) + 1)
+
+    def context_extent(self, call_stack, size):
+        """Input range the innermost context of `call_stack` may read.
+
+        The learned range only holds the positions seen to matter so far,
+        so it is extended up to the range of the next context called from
+        the same function, or else to `size`.
+        """
+        context_range = self.context_range(call_stack)
+        if context_range is None:
+            return None
+        call_context = call_stack.split("-")[-1]
+        caller = call_context.split(":")[0]
+        offset = context_range.start - min(self._context_map[call_context])
+        stop = size
+        for other_context, map_func in self._context_map.items():
+            if (
+                other_context != call_context
+                and other_context.split(":")[0] == caller
+                and len(map_func) > 0
+                and context_range.start < offset + min(map_func) < stop
+            ):
+                stop = offset + min(map_func)
+        return range(context_range.start, max(stop, context_range.stop))
+
+    def get_mutation_targets(self, path, size):
+        """Edits that may change which branches `path` takes.
+
+        Returns `(specs, ranges)`. `specs` are `(spec, offset, taken)`
+        triples: the learned predicate of an edge not taken by `path`, or
+        the negated predicate of a taken one, to be satisfied by the input
+        from `offset` on. `ranges` are the `context_extent`s of the call
+        contexts on `path` in an input of length `size`, innermost first.
+        """
+        bnodes = {node.label: node for node in self.branch_nodes()}
+        specs = []
+        for contcov, next_contcov in zip(path, path[1:]):
+            node = bnodes.get(contcov[1])
+            if node is None:
+                continue
+            offset = self.context_offset(contcov[0])
             for child in node:
-                print(f"Modeling {node} -> {child}...", end=" ")
-                context_child = self.get_context_nodes(child)
-                accepts = reduce(
-                    set.union,
-                    [self.get_input_in_context(node) for node in context_child],
-                ).intersection(pool)
-                rejects = pool - accepts
-                if len(accepts) and len(rejects):
-                    (
-                        formula,
-                        formula_str,
-                        conf,
-                        trial,
-                        max_trial,
-                    ) = self.estimate_predicate(
-                        list(accepts), list(rejects), max_trial
-                    )
-                    self._edge_condition[Edge(node, child)] = (
-                        formula_str,
-                        conf,
-                    )
-                    print(
-                        f"formula: <{formula_str}> (conf: {conf}, trial: ({trial} / {max_trial}))"
-                    )
-                else:
-                    self._edge_condition[Edge(node, child)] = (None, None)
-                    print("No accepts or rejects; skip.")
+                predicate, _ = self._edge_condition.get(
+                    Edge(node, child), (None, None)
+                )
+                if predicate is None:
+                    continue
+                taken = child.label == next_contcov[1]
+                if taken:
+                    predicate = predicate.negate()
+                specs.append((predicate, offset, taken))
+        call_stacks = sorted(
+            dict.fromkeys(contcov[0] for contcov in path if contcov[0] != ""),
+            key=lambda call_stack: -call_stack.count("-"),
+        )
+        ranges = []
+        for call_stack in call_stacks:
+            context_range = self.context_extent(call_stack, size)
+            if context_range is not None and context_range not in ranges:
+                ranges.append(context_range)
+        return specs, ranges
 
     def get_edge_cond(self):
         return self._edge_condition
 
+    def set_edge_cond(self, edge_condition):
+        self._edge_condition = edge_condition
+
     def get_context_map(self):
         return self._context_map
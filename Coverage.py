@@ -1,7 +1,26 @@
 import sys
+import weakref
+from array import array
+
+import numpy as np
 
 from Fuzzer import FunctionRunner
 
+# sys.monitoring (PEP 669) is only available from Python 3.12 on.
+HAS_MONITORING = hasattr(sys, "monitoring")
+# Tool ids not assigned by sys.monitoring; a tracer takes the first free
+# one, so that it runs alongside coverage.py and debuggers
+MONITORING_TOOL_IDS = (3, 4, 5)
+
+MAP_SIZE = 1 << 16
+
+# AFL's hit count classes: 1, 2, 3, 4-7, 8-15, 16-31, 32-127 and 128-255
+COUNT_CLASS = np.zeros(256, dtype=np.uint8)
+for _bit, (_lo, _hi) in enumerate(
+    [(1, 2), (2, 3), (3, 4), (4, 8), (8, 16), (16, 32), (32, 128), (128, 256)]
+):
+    COUNT_CLASS[_lo:_hi] = 1 << _bit
+
 
 class Coverage:
     def traceit(self, frame, event, arg):
@@ -89,9 +108,359 @@ class ContCov:
         return set(self.trace())
 
 
+class LabelTable:
+    """Interns contcov labels `(call_stack, (function_name, lineno))` as
+    small integer ids."""
+
+    def __init__(self) -> None:
+        self.labels = []
+        self._ids = {}
+        self._line_ids = {}
+
+    def intern(self, label) -> int:
+        if label not in self._ids:
+            self._ids[label] = len(self.labels)
+            self.labels.append(label)
+        return self._ids[label]
+
+    def find(self, label):
+        # Id of an interned `label`, or None
+        return self._ids.get(label)
+
+    def line_ids(self, call_stack, function_name):
+        # lineno -> id for the labels of one function in one call stack
+        key = (call_stack, function_name)
+        if key not in self._line_ids:
+            self._line_ids[key] = {}
+        return self._line_ids[key]
+
+    def decode(self, ids):
+        return [self.labels[label_id] for label_id in ids]
+
+
+# Shared by default so that ids agree between tracers of one process
+LABELS = LabelTable()
+
+
+class InternedContCov(ContCov):
+    """`ContCov` storing its trace as an `array("I")` of label ids.
+
+    The call stack string and the lineno -> id table of each frame are
+    looked up once on call, so a line event is a dict lookup and an append.
+    `trace()` decodes to the usual labels.
+    """
+
+    def traceit(self, frame, event, arg):
+        if self.original_trace_function is not None:
+            self.original_trace_function(frame, event, arg)
+
+        if event == "line":
+            call_stack, function_name, line_ids = self._frames[-1]
+            if line_ids is not None:
+                lineno = frame.f_lineno
+                label_id = line_ids.get(lineno)
+                if label_id is None:
+                    label_id = line_ids[lineno] = self._labels.intern(
+                        (call_stack, (function_name, lineno))
+                    )
+                self._trace.append(label_id)
+                self._prev_lineno = lineno
+
+        if event == "call":
+            function_name = frame.f_code.co_name
+            if len(self._call_stack):
+                # Update calling context
+                self._call_stack[-1] = (
+                    self._call_stack[-1].split(":")[0]
+                    + ":"
+                    + str(self._prev_lineno)
+                )
+            self._call_stack.append(function_name)
+            call_stack = "-".join(self._call_stack[1:-1])
+            line_ids = (
+                None
+                if function_name
+                in ["run_function", "coverage", "trace", "trace_ids"]
+                else self._labels.line_ids(call_stack, function_name)
+            )
+            self._frames.append((call_stack, function_name, line_ids))
+
+        if event == "return":
+            self._call_stack.pop()
+            self._frames.pop()
+
+        return self.traceit
+
+    def __init__(self, labels=None) -> None:
+        super().__init__()
+        self._labels = LABELS if labels is None else labels
+        self._trace = array("I")
+        self._frames = []
+
+    def trace_ids(self):
+        return self._trace
+
+    def trace(self):
+        return self._labels.decode(self._trace)
+
+
+class LocationTable:
+    """Gives every `(function_name, lineno)` location a pseudo-random
+    hash, AFL's compile-time block id, from which `EdgeCoverage` computes
+    the map index of an edge."""
+
+    def __init__(self) -> None:
+        self._hashes = {}
+
+    def hash(self, location) -> int:
+        if location not in self._hashes:
+            # Knuth's multiplicative hash spreads the sequential numbers
+            number = len(self._hashes) + 1
+            self._hashes[location] = (number * 2654435761) >> 8 & 0xFFFFFF
+        return self._hashes[location]
+
+
+# Shared by default so that map indices agree between tracers of one process
+LOCATIONS = LocationTable()
+
+
+class EdgeCoverage(Coverage):
+    """Records AFL-style edge hit counts into a `map_size` byte map.
+
+    The edge from location `prev` to `cur` counts at index
+    `(hash(cur) ^ hash(prev) >> 1) % map_size`; counts saturate at 255.
+    `trace()` holds each covered line once, in first-hit order, which is
+    all `coverage()` and `GreyboxFuzzerRecorder` need. `hits` is a zeroed
+    map to count into, e.g. the one of the previous run after `clear()`.
+    """
+
+    def traceit(self, frame, event, arg):
+        if self.original_trace_function is not None:
+            self.original_trace_function(frame, event, arg)
+
+        if event == "line":
+            location = (frame.f_code.co_name, frame.f_lineno)
+            cur = self._location_hashes.get(location)
+            if cur is None:
+                cur = self._location_hashes[location] = self._locations.hash(
+                    location
+                )
+                self._trace.append(location)
+            index = (cur ^ self._prev) & self._mask
+            hits = self._hits
+            count = hits[index]
+            if count < 255:
+                if not count:
+                    self._edges.append(index)
+                hits[index] = count + 1
+            self._prev = cur >> 1
+
+        return self.traceit
+
+    def __init__(self, map_size=MAP_SIZE, locations=None, hits=None) -> None:
+        super().__init__()
+        if map_size & (map_size - 1):
+            raise ValueError("map_size must be a power of two")
+        self._locations = LOCATIONS if locations is None else locations
+        self._location_hashes = {}
+        self._hits = bytearray(map_size) if hits is None else hits
+        self._mask = map_size - 1
+        self._prev = 0
+        # Map indices of the covered edges, in first-hit order
+        self._edges = []
+
+    def trace_bits(self):
+        return np.frombuffer(self._hits, dtype=np.uint8)
+
+    def edges(self):
+        return np.array(self._edges, dtype=np.intp)
+
+    def clear(self):
+        # Zero the map by the covered edges only, and return it
+        hits = self._hits
+        for index in self._edges:
+            hits[index] = 0
+        return hits
+
+
+def has_new_bits(virgin_bits, edges, hit_counts) -> bool:
+    """Whether the bucketed `hit_counts` of `edges` hit any bit still set
+    in `virgin_bits`; if so, those bits are cleared from `virgin_bits`.
+
+    Only the nonzero entries of a map need to be compared, e.g.
+    `edges = np.flatnonzero(trace_bits)` and `trace_bits[edges]`.
+    """
+    classified = COUNT_CLASS[hit_counts]
+    if not (classified & virgin_bits[edges]).any():
+        return False
+    virgin_bits[edges] &= ~classified
+    return True
+
+
+class MonitoringTracer:
+    """Mixin running a tracer on sys.monitoring instead of sys.settrace.
+
+    Subclasses provide `_on_call`, `_on_return` and `_on_line` callbacks
+    and `_relabel_exit`. Only frames started after `__enter__` are traced,
+    mirroring what sys.settrace sees. Unlike sys.settrace, events of all
+    threads are reported, so a tracer must not be shared across threads.
+    """
+
+    CALL_EVENTS = ("PY_START", "PY_RESUME", "PY_THROW")
+    RETURN_EVENTS = ("PY_RETURN", "PY_YIELD", "PY_UNWIND")
+
+    # code -> {jump offset: line of a backward jump within a single line};
+    # weak, so that traced code objects can still be freed
+    _loop_lines = weakref.WeakKeyDictionary()
+
+    def __enter__(self):
+        if not HAS_MONITORING:
+            raise RuntimeError("sys.monitoring requires Python 3.12+")
+        mon = sys.monitoring
+        for tool_id in MONITORING_TOOL_IDS:
+            if mon.get_tool(tool_id) is None:
+                break
+        else:
+            raise RuntimeError(
+                f"sys.monitoring tool ids {MONITORING_TOOL_IDS} are all in use"
+            )
+        mon.use_tool_id(tool_id, "controlflowmodel")
+        self._tool_id = tool_id
+        events = mon.events.LINE | mon.events.JUMP
+        mon.register_callback(tool_id, mon.events.LINE, self._on_line)
+        mon.register_callback(tool_id, mon.events.JUMP, self._on_jump)
+        for name in self.CALL_EVENTS:
+            event = getattr(mon.events, name)
+            mon.register_callback(tool_id, event, self._on_call)
+            events |= event
+        for name in self.RETURN_EVENTS:
+            event = getattr(mon.events, name)
+            mon.register_callback(tool_id, event, self._on_return)
+            events |= event
+        # Re-enable line events disabled by a previous first-hit-only run
+        mon.restart_events()
+        mon.set_events(tool_id, events)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        sys.monitoring.set_events(self._tool_id, 0)
+        sys.monitoring.free_tool_id(self._tool_id)
+        # sys.settrace reports the first line of the tracer's own __exit__;
+        # report ours under that label so both backends agree.
+        if self._trace:
+            self._trace[-1] = self._relabel_exit(self._trace[-1])
+
+    def _on_jump(self, code, src, dest):
+        # sys.settrace emits a line event for a backward jump that stays on
+        # the same line (e.g. one-line loops), where LINE does not fire.
+        loop_lines = self._loop_lines.get(code)
+        if loop_lines is None:
+            loop_lines = self._loop_lines[code] = {}
+        if src not in loop_lines:
+            loop_lines[src] = None
+            if dest < src:
+                lines = {
+                    offset: line
+                    for start, end, line in code.co_lines()
+                    for offset in (src, dest)
+                    if start <= offset < end
+                }
+                if lines.get(src) == lines.get(dest):
+                    loop_lines[src] = lines[dest]
+        line = loop_lines[src]
+        if line is None:
+            return sys.monitoring.DISABLE
+        return self._on_line(code, line)
+
+
+class MonitoringCoverage(MonitoringTracer, Coverage):
+    """`Coverage` on sys.monitoring.
+
+    With `first_hit_only`, each line event is disabled after its first hit,
+    so `trace()` holds every covered line once, in first-hit order. This
+    is all `coverage()` and `GreyboxFuzzerRecorder` need.
+    """
+
+    EXIT_LOCATION = ("__exit__", Coverage.__exit__.__code__.co_firstlineno + 1)
+
+    def __init__(self, first_hit_only=False) -> None:
+        super().__init__()
+        self._first_hit_only = first_hit_only
+        self._covered = set()
+        self._depth = 0
+
+    def _on_call(self, code, offset, arg=None):
+        self._depth += 1
+
+    def _on_return(self, code, offset, arg):
+        if self._depth:
+            self._depth -= 1
+
+    def _on_line(self, code, lineno):
+        if self._depth:
+            location = (code.co_name, lineno)
+            if not self._first_hit_only:
+                self._trace.append(location)
+            else:
+                # A line may start at several offsets; each fires once.
+                if location not in self._covered:
+                    self._covered.add(location)
+                    self._trace.append(location)
+                return sys.monitoring.DISABLE
+
+    def _relabel_exit(self, location):
+        return self.EXIT_LOCATION
+
+
+class MonitoringContCov(MonitoringTracer, ContCov):
+    """`ContCov` on sys.monitoring.
+
+    The joined call context of each frame is computed once on call instead
+    of on every line event.
+    """
+
+    EXIT_LOCATION = ("__exit__", ContCov.__exit__.__code__.co_firstlineno + 1)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._contexts = []
+
+    def _on_call(self, code, offset, arg=None):
+        if len(self._call_stack):
+            # Update calling context
+            self._call_stack[-1] = (
+                self._call_stack[-1].split(":")[0]
+                + ":"
+                + str(self._prev_lineno)
+            )
+        self._call_stack.append(code.co_name)
+        self._contexts.append("-".join(self._call_stack[1:-1]))
+
+    def _on_return(self, code, offset, arg):
+        if len(self._call_stack):
+            self._call_stack.pop()
+            self._contexts.pop()
+
+    def _on_line(self, code, lineno):
+        if len(self._call_stack) and code.co_name not in [
+            "run_function",
+            "coverage",
+            "trace",
+        ]:
+            self._trace.append((self._contexts[-1], (code.co_name, lineno)))
+            self._prev_lineno = lineno
+
+    def _relabel_exit(self, contcov):
+        return (contcov[0], self.EXIT_LOCATION)
+
+
 class FunctionCoverageRunner(FunctionRunner):
+    def __init__(self, function, tracer=Coverage) -> None:
+        super().__init__(function)
+        self.tracer = tracer
+
     def run_function(self, inp):
-        with Coverage() as cov:
+        with self.tracer() as cov:
             try:
                 result = super().run_function(inp)
             except Exception as exc:
@@ -111,8 +480,12 @@ class FunctionCoverageRunner(FunctionRunner):
 
 
 class FunctionContCovRunner(FunctionRunner):
+    def __init__(self, function, tracer=ContCov) -> None:
+        super().__init__(function)
+        self.tracer = tracer
+
     def run_function(self, inp):
-        with ContCov() as cov:
+        with self.tracer() as cov:
             try:
                 result = super().run_function(inp)
             except Exception as exc:
@@ -131,6 +504,71 @@ class FunctionContCovRunner(FunctionRunner):
         return self._coverage
 
 
+class InternedContCovRunner(FunctionContCovRunner):
+    """`FunctionContCovRunner` on `InternedContCov`.
+
+    `trace_ids()` and `coverage_ids()` give the raw label ids; `trace()`
+    and `coverage()` decode them on demand.
+    """
+
+    def __init__(self, function, labels=None) -> None:
+        super().__init__(function, tracer=InternedContCov)
+        self.labels = LABELS if labels is None else labels
+
+    def run_function(self, inp):
+        with self.tracer(self.labels) as cov:
+            try:
+                result = FunctionRunner.run_function(self, inp)
+            except Exception as exc:
+                self._trace_ids = cov.trace_ids()
+                # ContCov also covers what is traced up to here only
+                self._num_covered = len(self._trace_ids)
+                raise exc
+
+        self._trace_ids = cov.trace_ids()
+        self._num_covered = len(self._trace_ids)
+        return result
+
+    def trace_ids(self):
+        return self._trace_ids
+
+    def coverage_ids(self):
+        return set(self._trace_ids[: self._num_covered])
+
+    def trace(self):
+        return self.labels.decode(self._trace_ids)
+
+    def coverage(self):
+        return set(self.labels.decode(self.coverage_ids()))
+
+
+class FunctionBitmapRunner(FunctionCoverageRunner):
+    """`FunctionCoverageRunner` on `EdgeCoverage`.
+
+    `trace_bits()` is the edge hit count map of the last run and `edges()`
+    its nonzero indices. `coverage()` is the usual set of covered lines;
+    `trace()` holds each of them once, in first-hit order. The map is
+    allocated once and cleared by the next run, so copy it to keep it.
+    """
+
+    def __init__(self, function, map_size=MAP_SIZE, locations=None) -> None:
+        super().__init__(function, tracer=self._new_tracer)
+        self.map_size = map_size
+        self.locations = LOCATIONS if locations is None else locations
+        self._cov = None
+
+    def _new_tracer(self):
+        hits = None if self._cov is None else self._cov.clear()
+        self._cov = EdgeCoverage(self.map_size, self.locations, hits)
+        return self._cov
+
+    def trace_bits(self):
+        return self._cov.trace_bits()
+
+    def edges(self):
+        return self._cov.edges()
+
+
 def population_coverage(population, function):
     cumulative_coverage = []
     all_coverage = set()
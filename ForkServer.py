@@ -0,0 +1,219 @@
+import mmap
+import os
+import pickle
+import select
+import signal
+import struct
+import time
+
+from Fuzzer import Runner
+
+_LENGTH = struct.Struct("<Q")
+_REPLY = struct.Struct("<ii")
+# Shared buffer header: number of finished inputs, bytes used after header,
+# and whether the next result did not fit
+_BUFFER_HEADER = struct.Struct("<QQQ")
+
+
+def _read_exact(fd, size):
+    data = b""
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        if not chunk:
+            raise EOFError("fork server pipe closed")
+        data += chunk
+    return data
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while len(view):
+        view = view[os.write(fd, view) :]
+
+
+class ForkServerRunner(Runner):
+    """Runs inputs in forked children of a pre-warmed fork server.
+
+    The server is forked once from the current process, so the target and
+    `runner` are already loaded. For every batch of inputs it forks a child
+    that runs them with `runner` and writes `(result, outcome, trace,
+    coverage)` of each input into a shared memory buffer. A crash, hang or
+    state leak in the target therefore only affects its child.
+
+    An input running longer than `timeout` seconds is killed and reported
+    as `UNRESOLVED`; a child that exits or dies otherwise before finishing
+    an input is reported as `FAIL`, whatever its exit code. Neither has a
+    trace. Inputs after a killed one are rerun in a new child, as are the
+    inputs after one whose result does not fit into the rest of the
+    buffer. Forking is unsafe once other threads are running, so create
+    the runner before starting any.
+    """
+
+    # How a child ended
+    EXITED = 0
+    TIMEOUT = 1
+    CRASH = 2
+
+    def __init__(
+        self, runner, timeout=1.0, batch_size=1, buffer_size=1 << 24
+    ) -> None:
+        self.runner = runner
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self._buffer = mmap.mmap(-1, buffer_size)
+        request_read, self._request_fd = os.pipe()
+        self._reply_fd, reply_write = os.pipe()
+        self._server_pid = os.fork()
+        if self._server_pid == 0:
+            os.close(self._request_fd)
+            os.close(self._reply_fd)
+            try:
+                self._serve(request_read, reply_write)
+            finally:
+                os._exit(0)
+        os.close(request_read)
+        os.close(reply_write)
+        self._trace = []
+        self._coverage = set()
+
+    def _serve(self, request_fd, reply_fd):
+        while True:
+            try:
+                (size,) = _LENGTH.unpack(_read_exact(request_fd, _LENGTH.size))
+            except EOFError:
+                return
+            if size == 0:
+                return
+            inps = pickle.loads(_read_exact(request_fd, size))
+            _BUFFER_HEADER.pack_into(self._buffer, 0, 0, 0, 0)
+            pid = os.fork()
+            if pid == 0:
+                os.close(request_fd)
+                os.close(reply_fd)
+                self._run_child(inps)
+            status = self._wait_child(pid, self.timeout * len(inps) + 1)
+            _write_all(reply_fd, _REPLY.pack(*status))
+
+    def _run_child(self, inps):
+        # The exit code is the target's; results and overflow are reported
+        # in the buffer
+        try:
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+            for inp in inps:
+                # SIGALRM kills the child if the input hangs
+                signal.setitimer(signal.ITIMER_REAL, self.timeout)
+                result, outcome = self.runner.run(inp)
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                trace, coverage = self.runner.trace(), self.runner.coverage()
+                try:
+                    data = pickle.dumps((result, outcome, trace, coverage))
+                except Exception:
+                    data = pickle.dumps((None, outcome, trace, coverage))
+                count, used, _ = _BUFFER_HEADER.unpack_from(self._buffer, 0)
+                offset = _BUFFER_HEADER.size + used
+                end = offset + _LENGTH.size + len(data)
+                if end > len(self._buffer):
+                    _BUFFER_HEADER.pack_into(self._buffer, 0, count, used, 1)
+                    break
+                _LENGTH.pack_into(self._buffer, offset, len(data))
+                self._buffer[offset + _LENGTH.size : end] = data
+                _BUFFER_HEADER.pack_into(
+                    self._buffer, 0, count + 1, end - _BUFFER_HEADER.size, 0
+                )
+        finally:
+            os._exit(0)
+
+    def _wait_child(self, pid, timeout):
+        deadline = time.monotonic() + timeout
+        pidfd = os.pidfd_open(pid) if hasattr(os, "pidfd_open") else None
+        try:
+            wpid, status = os.waitpid(pid, os.WNOHANG)
+            while wpid == 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Watchdog for children that block SIGALRM
+                    os.kill(pid, signal.SIGKILL)
+                    wpid, status = os.waitpid(pid, 0)
+                elif pidfd is None:
+                    time.sleep(min(remaining, 0.0005))
+                    wpid, status = os.waitpid(pid, os.WNOHANG)
+                else:
+                    select.select([pidfd], [], [], remaining)
+                    wpid, status = os.waitpid(pid, os.WNOHANG)
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
+        if os.WIFSIGNALED(status):
+            sig = os.WTERMSIG(status)
+            if sig in (signal.SIGALRM, signal.SIGKILL):
+                return self.TIMEOUT, sig
+            return self.CRASH, sig
+        return self.EXITED, os.WEXITSTATUS(status)
+
+    def _read_buffer(self):
+        # (results, whether the next result did not fit)
+        count, _, overflow = _BUFFER_HEADER.unpack_from(self._buffer, 0)
+        offset = _BUFFER_HEADER.size
+        results = []
+        for _ in range(count):
+            (size,) = _LENGTH.unpack_from(self._buffer, offset)
+            offset += _LENGTH.size
+            results.append(pickle.loads(self._buffer[offset : offset + size]))
+            offset += size
+        return results, bool(overflow)
+
+    def _run_in_child(self, inps):
+        data = pickle.dumps(list(inps))
+        _write_all(self._request_fd, _LENGTH.pack(len(data)) + data)
+        status, _ = _REPLY.unpack(_read_exact(self._reply_fd, _REPLY.size))
+        return (status, *self._read_buffer())
+
+    def run_batch(self, inps):
+        """Run `inps`; returns `(result, outcome, trace, coverage)` each."""
+        results = []
+        while len(results) < len(inps):
+            batch = inps[len(results) : len(results) + self.batch_size]
+            status, finished, overflow = self._run_in_child(batch)
+            results.extend(finished)
+            if len(finished) == len(batch):
+                continue
+            if overflow:
+                if finished:
+                    # Rerun the rest with the whole buffer
+                    continue
+                raise RuntimeError(
+                    "A trace does not fit into the shared buffer; "
+                    "increase buffer_size."
+                )
+            # The child died on the next input, e.g. by os._exit()
+            if status == self.TIMEOUT:
+                results.append((None, self.UNRESOLVED, [], set()))
+            else:
+                results.append((None, self.FAIL, [], set()))
+        return results
+
+    def run(self, inp):
+        ((result, outcome, self._trace, self._coverage),) = self.run_batch(
+            [inp]
+        )
+        return result, outcome
+
+    def trace(self):
+        return self._trace
+
+    def coverage(self):
+        return self._coverage
+
+    def close(self) -> None:
+        if self._server_pid:
+            _write_all(self._request_fd, _LENGTH.pack(0))
+            os.waitpid(self._server_pid, 0)
+            os.close(self._request_fd)
+            os.close(self._reply_fd)
+            self._server_pid = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
@@ -1,18 +1,132 @@
 import numpy as np
 import operator
-from random import choice, randint, random
+from random import choice, randint
+
+from Predicate import OP_STRS, Binary, InRange, Length, OutRange, Unary
+
+
+def encode_inputs(inputs):
+    """Encode strings as a padded code-point matrix and a length vector.
+
+    Row `i` holds the code points of `inputs[i]`, padded with -1.
+    """
+    lengths = np.fromiter(map(len, inputs), dtype=np.int64, count=len(inputs))
+    width = max(int(lengths.max(initial=0)), 1)
+    codes = np.frombuffer(
+        "".join(inputs).encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+    )
+    matrix = np.full((len(inputs), width), -1, dtype=np.int32)
+    matrix[np.arange(width) < lengths[:, None]] = codes
+    return matrix, lengths
+
+
+def _max_run(weights):
+    # (sum, first, last) of the contiguous run of `weights` with the
+    # largest sum; the earliest and then shortest run wins ties
+    best, best_first, best_last = weights[0], 0, 0
+    run, first = 0, 0
+    for index, weight in enumerate(weights):
+        if run <= 0:
+            run, first = weight, index
+        else:
+            run += weight
+        if run > best:
+            best, best_first, best_last = run, first, index
+    return best, best_first, best_last
+
+
+def candidate_predicates(matrix, lengths, signs):
+    """The best predicate of each kind, op and position on an encoded pool.
+
+    `signs` is +1 for inputs to accept and -1 for inputs to reject. Yields
+    `(score, predicate, num_scored)`, where the score is `signs @ hits`
+    and the predicate is the best of `num_scored` candidates, in this
+    order:
+
+    - `len(x) op n` for every op and length `n` in the pool,
+    - `x[i] == c` and `x[i] != c` for every code point `c` seen at `i`,
+    - `lo <= x[i] <= hi` and its complement, for all ranges of code points
+      seen at `i`,
+    - `x[i] op x[j]` for every op and positions `i < j`.
+
+    All candidates of one kind and position are scored in one NumPy
+    operation, ranges through a maximum-sum run over the seen code points.
+    """
+    sizes = np.unique(lengths)
+    for op in OP_STRS:
+        scores = signs @ op(lengths[:, None], sizes)
+        index = int(np.argmax(scores))
+        yield scores[index], Length(op, int(sizes[index])), len(sizes)
+
+    width = matrix.shape[1]
+    for pos in range(width):
+        present = lengths > pos
+        if not present.any():
+            break
+        values, inverse = np.unique(matrix[present, pos], return_inverse=True)
+        weights = np.bincount(
+            inverse, weights=signs[present], minlength=len(values)
+        ).astype(np.int64)
+        total = int(weights.sum())
+        index = int(np.argmax(weights))
+        yield (
+            weights[index],
+            Unary(pos, operator.eq, chr(values[index])),
+            len(values),
+        )
+        index = int(np.argmin(weights))
+        yield (
+            total - weights[index],
+            Unary(pos, operator.ne, chr(values[index])),
+            len(values),
+        )
+        weights = weights.tolist()
+        num_ranges = len(values) * (len(values) + 1) // 2
+        # Ranges of one code point are written as (in)equalities
+        score, first, last = _max_run(weights)
+        if first == last:
+            predicate = Unary(pos, operator.eq, chr(values[first]))
+        else:
+            predicate = InRange(pos, chr(values[first]), chr(values[last]))
+        yield score, predicate, num_ranges
+        score, first, last = _max_run([-weight for weight in weights])
+        if first == last:
+            predicate = Unary(pos, operator.ne, chr(values[first]))
+        else:
+            predicate = OutRange(pos, chr(values[first]), chr(values[last]))
+        yield total + score, predicate, num_ranges
+
+    for pos1 in range(width - 1):
+        present = lengths[:, None] > np.arange(pos1 + 1, width)
+        for op in OP_STRS:
+            hits = op(matrix[:, pos1, None], matrix[:, pos1 + 1 :]) & present
+            scores = signs @ hits
+            index = int(np.argmax(scores))
+            yield (
+                scores[index],
+                Binary(pos1, op, pos1 + 1 + index),
+                width - pos1 - 1,
+            )
+
+
+def best_predicate(matrix, lengths, signs):
+    """The predicate of highest fitness on an encoded pool, by enumeration.
+
+    Ties go to the earliest of `candidate_predicates`, so the result only
+    depends on the pool. Returns the best predicate and the number of
+    candidates scored.
+    """
+    best, best_score, num_candidates = None, None, 0
+    candidates = candidate_predicates(matrix, lengths, signs)
+    for score, predicate, num_scored in candidates:
+        if best_score is None or score > best_score:
+            best, best_score = predicate, score
+        num_candidates += num_scored
+    return best, num_candidates
 
 
 class PredicateGenerator:
     def __init__(self) -> None:
-        self.map_op_str = {
-            operator.eq: "==",
-            operator.le: "<=",
-            operator.ge: ">=",
-            operator.ne: "!=",
-            operator.lt: "<",
-            operator.gt: ">",
-        }
         self.positive_ops = [
             operator.eq,
             operator.le,
@@ -33,9 +147,7 @@ class PredicateGenerator:
             if self.is_positive
             else choice(self.negative_ops)
         )
-        formula = lambda x: op(x[pos], val) if len(x) > pos else False
-        formula_str = f"lambda x: x[{pos}] {self.map_op_str[op]} '{val}'"
-        return formula, formula_str
+        return Unary(pos, op, val)
 
     def gen_binary_comp(self):
         pos1 = randint(0, self.curr_input_size - 1)
@@ -46,13 +158,12 @@ class PredicateGenerator:
         if not self.is_positive:
             sat_ops = set(self.ops) - sat_ops
         op = choice(list(sat_ops))
-        formula = (
-            lambda x: op(x[pos1], x[pos2])
-            if len(x) > max({pos1, pos2})
-            else False
-        )
-        formula_str = f"lambda x: x[{pos1}] {self.map_op_str[op]} x[{pos2}]"
-        return formula, formula_str
+        return Binary(pos1, op, pos2)
+
+    def choose_from(self, values: range) -> int:
+        # Same draw as `np.random.choice(values)`, without building an
+        # array of up to 0x110000 elements
+        return values.start + np.random.randint(0, len(values))
 
     def get_range_comp(self):
         pos = randint(0, self.curr_input_size - 1)
@@ -61,35 +172,19 @@ class PredicateGenerator:
             posval, 0x10FFFF + 1
         )
         if self.is_positive:
-            lessval = chr(np.random.choice(less_range))
-            greaterval = chr(np.random.choice(greater_range))
-            # print(lessval, greaterval)
-            formula = (
-                lambda x: x[pos] >= lessval and x[pos] <= greaterval
-                if len(x) > pos
-                else False
-            )
-            formula_str = f"lambda x: '{lessval}' <= x[{pos}] <= '{greaterval}'"
+            lessval = chr(self.choose_from(less_range))
+            greaterval = chr(self.choose_from(greater_range))
+            return InRange(pos, lessval, greaterval)
         elif posval == 0:
-            greaterval = chr(np.random.choice(greater_range))
-            formula = lambda x: x[pos] > greaterval if len(x) > pos else False
-            formula_str = f"lambda: x x[{pos}] > '{greaterval}'"
+            greaterval = chr(self.choose_from(greater_range))
+            return Unary(pos, operator.gt, greaterval)
         elif posval == 0x10FFFF:
-            lessval = chr(np.random.choice(less_range))
-            formula = lambda x: x[pos] < lessval if len(x) > pos else False
-            formula_str = f"lambda: x x[{pos}] < '{lessval}'"
+            lessval = chr(self.choose_from(less_range))
+            return Unary(pos, operator.lt, lessval)
         else:
-            lessval = chr(np.random.choice(less_range))
-            greaterval = chr(np.random.choice(greater_range))
-            formula = (
-                lambda x: x[pos] < lessval or x[pos] > greaterval
-                if len(x) > pos
-                else False
-            )
-            formula_str = (
-                f"lambda: x x[{pos}] < '{lessval}' or x[{pos}] > '{greaterval}'"
-            )
-        return formula, formula_str
+            lessval = chr(self.choose_from(less_range))
+            greaterval = chr(self.choose_from(greater_range))
+            return OutRange(pos, lessval, greaterval)
 
     def generate(self, sample_input, is_positive):
         self.curr_input = sample_input
@@ -97,9 +192,9 @@ class PredicateGenerator:
         self.curr_input_size = len(sample_input)
         if self.curr_input_size == 0:
             if is_positive:
-                return lambda x: len(x) == 0, "lambda x: len(x) == 0"
+                return Length(operator.eq, 0)
             else:
-                return lambda x: len(x) != 0, "lambda x: len(x) != 0"
+                return Length(operator.ne, 0)
         elif self.curr_input_size == 1:
             if np.random.random() < 0.5:
                 return self.gen_unary_comp()
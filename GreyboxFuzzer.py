@@ -1,49 +1,371 @@
 import random
+from array import array
+from collections.abc import Mapping
+from hashlib import blake2b
 from typing import List
 
-from Coverage import FunctionCoverageRunner, population_coverage
+import numpy as np
+
+from Coverage import (
+    LABELS,
+    FunctionBitmapRunner,
+    FunctionCoverageRunner,
+    InternedContCovRunner,
+    has_new_bits,
+    population_coverage,
+)
 from example.python.crash import crashme
 from MutationFuzzer import MutationFuzzer, Mutator, PowerSchedule, Seed
 
 
+class PathNode:
+    """A path of a path trie: the labels from the root to this node.
+
+    Paths sharing a prefix share its nodes, and a trie has one node per
+    path, so nodes compare by identity. The hash is derived from the
+    parent's when the node is created. A node iterates like the tuple of
+    its labels, which `labels()` builds on demand, and pickles as that
+    tuple.
+
+    `children` also maps the labels already on the path to the node
+    itself, so a trace walks down to its path of first hits with one
+    lookup per event. A recorder may keep a `key` for the path.
+    """
+
+    __slots__ = ("label", "parent", "depth", "children", "key", "_hash")
+
+    def __init__(self, label=None, parent=None) -> None:
+        self.label = label
+        self.parent = parent
+        self.children = {}
+        self.key = None
+        if parent is None:
+            self.depth = 0
+            self._hash = hash(())
+        else:
+            self.depth = parent.depth + 1
+            self._hash = hash((parent._hash, label))
+
+    def add_child(self, label):
+        child = self.children.get(label)
+        if child is None:
+            if self._on_path(label):
+                child = self.children[label] = self
+            else:
+                child = self.children[label] = PathNode(label, self)
+        return child
+
+    def _on_path(self, label) -> bool:
+        node = self
+        while node.parent is not None:
+            if node.label == label:
+                return True
+            node = node.parent
+        return False
+
+    def labels(self):
+        labels = [None] * self.depth
+        node = self
+        while node.parent is not None:
+            labels[node.depth - 1] = node.label
+            node = node.parent
+        return tuple(labels)
+
+    def __iter__(self):
+        return iter(self.labels())
+
+    def __len__(self) -> int:
+        return self.depth
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        return self is other
+
+    def __reduce__(self):
+        return tuple, (self.labels(),)
+
+    def __repr__(self) -> str:
+        return repr(self.labels())
+
+
 class GreyboxFuzzer(MutationFuzzer):
     def reset(self):
         super().reset()
         self.coverages_seen = set()
         self.population = []
+        # AFL's virgin map, allocated on the first run of a bitmap runner
+        self.virgin_bits = None
+        self.schedule.encode_coverage = self.encode_coverage
+
+    def coverage_key(self, runner: FunctionCoverageRunner):
+        return frozenset(runner.coverage())
+
+    def encode_coverage(self, coverage):
+        # Key of a `Seed.coverage` in `coverages_seen`
+        return frozenset(coverage)
+
+    def has_new_coverage(
+        self, runner: FunctionCoverageRunner, key=None
+    ) -> bool:
+        # `key` is the `coverage_key` of `runner`, if already computed
+        if isinstance(runner, FunctionBitmapRunner):
+            if self.virgin_bits is None:
+                self.virgin_bits = np.full(runner.map_size, 255, np.uint8)
+            edges = runner.edges()
+            return has_new_bits(
+                self.virgin_bits, edges, runner.trace_bits()[edges]
+            )
+        if key is None:
+            key = self.coverage_key(runner)
+        if key in self.coverages_seen:
+            return False
+        self.coverages_seen.add(key)
+        return True
 
     def run(self, runner: FunctionCoverageRunner):
         result, outcome = super().run(runner)
-        new_coverage = frozenset(runner.coverage())
-        if new_coverage not in self.coverages_seen:
+        # The coverage key is computed once, and only if it is needed
+        observes = type(self.schedule).observe is not PowerSchedule.observe
+        key = None
+        if observes or not isinstance(runner, FunctionBitmapRunner):
+            key = self.coverage_key(runner)
+        if self.has_new_coverage(runner, key):
             seed = Seed(self.inp)
             seed.coverage = runner.coverage()
-            self.coverages_seen.add(new_coverage)
             self.population.append(seed)
+        if observes:
+            self.schedule.observe(self.population, key)
+        if self.stats.enabled:
+            self.stats.count("executions")
+            self.stats.count("trace_events", len(runner.trace()))
+            self.stats.tick()
 
         return (result, outcome)
 
 
 class GreyboxFuzzerRecorder(GreyboxFuzzer):
+    """Records up to `max_inputs` inputs for every path.
+
+    Paths are stored in a trie of `PathNode`s rooted at `path_trie`, and
+    the inputs of a path are a uniform reservoir sample of the executions
+    taking it. Subscribers are told about added inputs, and eviction
+    subscribers about the inputs these replace. `get_record()` is a
+    `RecordView` of `cov_record` keyed by label paths.
+    """
+
     def __init__(
-        self, seeds: List, mutator: Mutator, schedule: PowerSchedule
+        self,
+        seeds: List,
+        mutator: Mutator,
+        schedule: PowerSchedule,
+        max_inputs=10,
     ) -> None:
         super().__init__(seeds, mutator, schedule)
+        self.max_inputs = max_inputs
         self.cov_record = {}
+        self.subscribers = []
+        self.evict_subscribers = []
+        self.path_trie = PathNode()
+        # Executions seen per path, and its sample as a list for eviction
+        self.path_counts = {}
+        self._samples = {}
+        self._record_view = None
+
+    def __getstate__(self):
+        # Paths pickle as tuples; the trie is rebuilt from them
+        state = self.__dict__.copy()
+        del state["path_trie"]
+        state["_record_view"] = None
+        return state
+
+    def __setstate__(self, state) -> None:
+        self.__dict__.update(state)
+        self.path_trie = PathNode()
+        for name in ("cov_record", "path_counts", "_samples"):
+            setattr(
+                self,
+                name,
+                {
+                    self.encode_path(key) if type(key) is tuple else key: value
+                    for key, value in getattr(self, name).items()
+                },
+            )
+
+    def subscribe(self, callback) -> None:
+        # `callback(path, inp)` is called whenever `inp` is recorded
+        self.subscribers.append(callback)
+
+    def subscribe_evictions(self, callback) -> None:
+        # `callback(path, inp)` is called whenever `inp` is evicted from
+        # the sample of `path`, just before its replacement is recorded
+        self.evict_subscribers.append(callback)
 
     def run(self, runner: FunctionCoverageRunner):
         result, outcome = super().run(runner)
-        # preserve covered element order -> ordered coverage := overage
-        new_overage = tuple(dict.fromkeys(runner.trace()).keys())
+        new_overage = self.path_key(runner)
         if new_overage not in self.cov_record:
             self.cov_record[new_overage] = set()
-        if len(self.cov_record[new_overage]) < 10:
-            self.cov_record[new_overage].add(self.inp)
+            self.stats.count("paths")
+        self.sample_input(new_overage, self.inp)
 
         return (result, outcome)
 
+    def sample_input(self, key, inp) -> None:
+        # Algorithm R over the executions of path `key`
+        inputs = self.cov_record[key]
+        count = self.path_counts[key] = self.path_counts.get(key, 0) + 1
+        if inp in inputs:
+            return
+        samples = self._samples.get(key)
+        if samples is None or len(samples) != len(inputs):
+            samples = self._samples[key] = list(inputs)
+        if len(samples) < self.max_inputs:
+            samples.append(inp)
+            evicted = None
+        else:
+            slot = random.randrange(count)
+            if slot >= self.max_inputs:
+                return
+            evicted = samples[slot]
+            inputs.discard(evicted)
+            samples[slot] = inp
+        inputs.add(inp)
+        if self.subscribers or self.evict_subscribers:
+            path = self.decode_path(key)
+            if evicted is not None:
+                for callback in self.evict_subscribers:
+                    callback(path, evicted)
+            for callback in self.subscribers:
+                callback(path, inp)
+
+    def path_key(self, runner: FunctionCoverageRunner):
+        # preserve covered element order -> ordered coverage := overage,
+        # found by walking the trace down the path trie
+        return self.walk_trie(runner.trace())
+
+    def walk_trie(self, trace):
+        node = self.path_trie
+        for label in trace:
+            try:
+                node = node.children[label]
+            except KeyError:
+                node = node.add_child(label)
+        return node
+
+    def find_path(self, path):
+        # Key of a known `path`, or None; unlike `encode_path`, adds nothing
+        node = self.path_trie
+        for label in path:
+            node = node.children.get(label)
+            if node is None:
+                return None
+        return node
+
+    def decode_path(self, key):
+        return key.labels()
+
+    def encode_path(self, path):
+        return self.walk_trie(path)
+
     def get_record(self):
-        return self.cov_record
+        if self._record_view is None:
+            self._record_view = RecordView(self)
+        return self._record_view
+
+
+class InternedFuzzerRecorder(GreyboxFuzzerRecorder):
+    """`GreyboxFuzzerRecorder` for an `InternedContCovRunner`.
+
+    Coverage is compared as sets of label ids, and `cov_record` is keyed by
+    a digest of the ordered label ids of each path, kept in `paths`. Traces
+    walk `path_trie` over label ids, whose nodes keep the digests.
+    """
+
+    def __init__(
+        self,
+        seeds: List,
+        mutator: Mutator,
+        schedule: PowerSchedule,
+        labels=None,
+        max_inputs=10,
+    ) -> None:
+        super().__init__(seeds, mutator, schedule, max_inputs)
+        self.labels = LABELS if labels is None else labels
+        self.paths = {}
+
+    def coverage_key(self, runner: InternedContCovRunner):
+        return frozenset(runner.coverage_ids())
+
+    def encode_coverage(self, coverage):
+        return frozenset(map(self.labels.intern, coverage))
+
+    def path_key(self, runner: InternedContCovRunner):
+        node = self.walk_trie(runner.trace_ids())
+        if node.key is None:
+            node.key = self.add_path(array("I", node.labels()))
+        return node.key
+
+    def add_path(self, ids):
+        key = blake2b(ids.tobytes(), digest_size=16).digest()
+        if key not in self.paths:
+            self.paths[key] = ids
+        return key
+
+    def find_path(self, path):
+        # Key of a known `path`, or None; unlike `encode_path`, adds nothing
+        ids = [self.labels.find(label) for label in path]
+        if None in ids:
+            return None
+        key = blake2b(array("I", ids).tobytes(), digest_size=16).digest()
+        return key if key in self.paths else None
+
+    def decode_path(self, key):
+        return tuple(self.labels.decode(self.paths[key]))
+
+    def encode_path(self, path):
+        return self.add_path(array("I", map(self.labels.intern, path)))
+
+
+class RecordView(Mapping):
+    """Live view of the `cov_record` of a `GreyboxFuzzerRecorder`, keyed
+    by label paths.
+
+    Like `cov_record`, it only grows, in the order paths are found, so
+    `ControlFlowModel` can index it incrementally. Each path is decoded
+    once. A view pickles as a dict of the record.
+    """
+
+    def __init__(self, recorder: GreyboxFuzzerRecorder) -> None:
+        self._recorder = recorder
+        # digest -> decoded path, and back
+        self._paths = {}
+        self._keys = {}
+
+    def _decode(self, key):
+        path = self._paths.get(key)
+        if path is None:
+            path = self._paths[key] = self._recorder.decode_path(key)
+            self._keys[path] = key
+        return path
+
+    def __getitem__(self, path):
+        key = self._keys.get(path)
+        if key is None:
+            key = self._recorder.find_path(path)
+        if key is None or key not in self._recorder.cov_record:
+            raise KeyError(path)
+        return self._recorder.cov_record[key]
+
+    def __iter__(self):
+        return map(self._decode, self._recorder.cov_record)
+
+    def __len__(self) -> int:
+        return len(self._recorder.cov_record)
+
+    def __reduce__(self):
+        return dict, (list(self.items()),)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+import random
+
+from ControlFlowModel import ControlFlowModel
+from MutationFuzzer import AFLFastSchedule, Mutator
+
+
+class ModelGuidedMutator(Mutator):
+    """`Mutator` steered by a fitted `ControlFlowModel`.
+
+    The targets of a seed come from the model's `get_mutation_targets` for
+    its path. With probability `guided_prob`, a mutation is guided: with
+    probability `spec_prob` it satisfies one of the target predicates,
+    flipping a branch on the path, and otherwise it replaces a character
+    in one of the target context ranges, keeping the input length. Other
+    mutations, and those of seeds without targets, are uniform.
+
+    Positions read by the predicates of taken edges already decide the
+    path, so range replacements skip them.
+
+    A seed is traced once with the model's runner; the later mutations of
+    a stacked mutation use the targets of the seed they started from.
+    """
+
+    def __init__(
+        self, model: ControlFlowModel, guided_prob=0.8, spec_prob=0.25
+    ) -> None:
+        super().__init__()
+        self.model = model
+        self.guided_prob = guided_prob
+        self.spec_prob = spec_prob
+        self._targets = {}
+        # The last mutant and the targets of its seed
+        self._last_mutant, self._last_targets = None, None
+
+    def targets(self, inp):
+        """`(specs, positions)`: `(spec, offset)` pairs to satisfy, and the
+        free positions of each context range."""
+        if inp not in self._targets:
+            specs, ranges = self.model.get_mutation_targets(
+                self.model.get_path(inp), len(inp)
+            )
+            fixed = {
+                offset + pos
+                for spec, offset, taken in specs
+                if taken
+                for pos in spec.positions()
+            }
+            positions = []
+            for context_range in ranges:
+                free = [pos for pos in context_range if pos not in fixed]
+                positions.append(free or list(context_range))
+            self._targets[inp] = (
+                [(spec, offset) for spec, offset, _ in specs],
+                positions,
+            )
+        return self._targets[inp]
+
+    def replace_at(self, s, positions):
+        positions = [pos for pos in positions if pos < len(s)]
+        if not positions:
+            return None
+        pos = random.choice(positions)
+        random_character = self.generate_other_character(s[pos])
+        return s[:pos] + random_character + s[pos + 1 :]
+
+    def mutate(self, inp):
+        if inp == self._last_mutant:
+            targets = self._last_targets
+        else:
+            targets = self.targets(inp)
+        specs, positions = targets
+        mutant = None
+        if (specs or positions) and random.random() < self.guided_prob:
+            if specs and (not positions or random.random() < self.spec_prob):
+                spec, offset = random.choice(specs)
+                mutant = spec.satisfy(inp, offset)
+            else:
+                mutant = self.replace_at(inp, random.choice(positions))
+        if mutant is None:
+            mutant = super().mutate(inp)
+        self._last_mutant, self._last_targets = mutant, targets
+        return mutant
+
+
+class ModelGuidedSchedule(AFLFastSchedule):
+    """`AFLFastSchedule` favoring seeds that reach deep call contexts.
+
+    The energy of a seed is multiplied by `2 ** len(positions) * (1 +
+    len(specs))` for its targets in `mutator`. By default, the AFLFast
+    energy itself is constant (`"freq"` with exponent 0).
+    """
+
+    def __init__(
+        self,
+        mutator: ModelGuidedMutator,
+        schedule="freq",
+        exponent=0,
+        **kwargs,
+    ) -> None:
+        super().__init__(schedule, exponent, **kwargs)
+        self.mutator = mutator
+
+    def _seed_energy(self, index) -> float:
+        specs, positions = self.mutator.targets(self._population[index].data)
+        return (
+            super()._seed_energy(index)
+            * 2 ** len(positions)
+            * (1 + len(specs))
+        )
+
+
+if __name__ == "__main__":
+    import time
+
+    from Coverage import FunctionContCovRunner
+    from example.python.crash import crashme3
+    from graph import Graph
+    from GreyboxFuzzer import GreyboxFuzzer, GreyboxFuzzerRecorder
+    from MutationFuzzer import PowerSchedule
+
+    n = 100000
+    seeds = ["000abcdefghijkl", "100asdfasdfqwer", "010asdfasdfqwer"]
+    recorder = GreyboxFuzzerRecorder(seeds, Mutator(), PowerSchedule())
+    recorder.runs(FunctionContCovRunner(crashme3), trials=5000)
+    record = recorder.get_record()
+    contcov_graph, coverage_graph = Graph(), Graph()
+    for path in record:
+        contcov_graph.accept(path)
+        coverage_graph.accept([contcov[1] for contcov in path])
+    model = ControlFlowModel(
+        record, contcov_graph, coverage_graph, FunctionContCovRunner(crashme3)
+    )
+    model.identify_branch()
+    model.model_context(inp_sample_size=3, mut_trial=20)
+    model.model_condition()
+
+    mutator = ModelGuidedMutator(model)
+    for name, fuzzer in [
+        ("uniform", GreyboxFuzzer(seeds, Mutator(), PowerSchedule())),
+        (
+            "guided",
+            GreyboxFuzzer(seeds, mutator, ModelGuidedSchedule(mutator)),
+        ),
+    ]:
+        runner = FunctionContCovRunner(crashme3)
+        start = time.time()
+        for trial in range(1, n + 1):
+            fuzzer.run(runner)
+            if ("crashme", 6) in {contcov[1] for contcov in runner.coverage()}:
+                print(
+                    f"The {name} fuzzer reached the deep bug after {trial} "
+                    f"inputs ({time.time() - start:.2f} seconds)."
+                )
+                break
+        else:
+            print(f"The {name} fuzzer missed the deep bug in {n} inputs.")
@@ -1,22 +1,34 @@
 import random
 from typing import List
 
+import numpy as np
+
 from Coverage import FunctionCoverageRunner, population_coverage
 from example.python.crash import crashme
 from Fuzzer import Fuzzer
+from Stats import NULL_STATS
 
 
 class Mutator:
-    def __init__(self):
+    def __init__(self, batch_size=1):
         self.mutators = [
             self.delete_random_character,
             self.insert_random_character,
             self.flip_random_character,
         ]
+        # Mutants `MutationFuzzer` takes per chosen seed
+        self.batch_size = batch_size
 
     def generate_random_character(self):
         return chr(random.randrange(32, 127))
 
+    def generate_other_character(self, c):
+        # A random character other than `c`, without retrying
+        if not 32 <= ord(c) < 127:
+            return self.generate_random_character()
+        code = random.randrange(32, 126)
+        return chr(code + 1 if code >= ord(c) else code)
+
     def insert_random_character(self, s):
         pos = random.randint(0, len(s))
         random_character = self.generate_random_character()
@@ -43,8 +55,119 @@ class Mutator:
         mutator = random.choice(self.mutators)
         return mutator(inp)
 
+    def havoc(self, inp, k=1):
+        # `k` mutants of `inp`, each stacking up to 32 mutations
+        mutants = []
+        for _ in range(k):
+            candidate = inp
+            trials = min(len(candidate), 1 << random.randint(1, 5))
+            for _ in range(trials):
+                candidate = self.mutate(candidate)
+            mutants.append(candidate)
+        return mutants
+
+
+class HavocMutator(Mutator):
+    """Generates `batch_size` mutants of a seed in one vectorized call.
+
+    `havoc` applies the stacked deletions, insertions and bit flips of
+    `Mutator` to the rows of a code point buffer, one NumPy operation per
+    stacked mutation for all rows, and decodes the rows to `str` only at
+    the end. The buffers are reused across calls. Randomness comes from
+    `np.random`.
+
+    `MutationFuzzer` runs a whole batch before it chooses the next seed,
+    so seeds found and schedule feedback observed during a batch only
+    take effect once it is used up. Larger batches amortize the NumPy
+    overhead better but react to new coverage later.
+    """
+
+    DELETE, INSERT, FLIP = range(3)
+
+    def __init__(self, batch_size=256) -> None:
+        super().__init__(batch_size)
+        self._buffer = np.empty((0, 0), dtype=np.uint32)
+        self._shifted = np.empty((0, 0), dtype=np.uint32)
+        self._mask = np.empty((0, 0), dtype=bool)
+
+    def _buffers(self, k, width):
+        if k > self._buffer.shape[0] or width > self._buffer.shape[1]:
+            shape = (
+                max(k, self._buffer.shape[0]),
+                max(width, self._buffer.shape[1]),
+            )
+            self._buffer = np.empty(shape, dtype=np.uint32)
+            self._shifted = np.empty(shape, dtype=np.uint32)
+            self._mask = np.empty(shape, dtype=bool)
+        return (
+            self._buffer[:k, :width],
+            self._shifted[:k, :width],
+            self._mask[:k, :width],
+        )
+
+    def havoc(self, inp, k=1):
+        codes = np.frombuffer(
+            inp.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+        )
+        depths = np.minimum(len(codes), 1 << np.random.randint(1, 6, k))
+        # Rows are sorted by stack depth, so that the rows still mutating
+        # in a step are a prefix; mutants come out in generation order
+        order = np.argsort(-depths, kind="stable")
+        stacks = depths[order]
+        num_steps = int(stacks.max(initial=0))
+        # Every stacked mutation inserts at most one character
+        width = max(len(codes) + num_steps, 1)
+        buffer, shifted, mask = self._buffers(k, width)
+        buffer[:, : len(codes)] = codes
+        lengths = np.full(k, len(codes))
+        columns = np.arange(width)
+        all_ops = np.random.randint(0, 3, (num_steps, k))
+        all_pos = np.random.random((num_steps, k))
+        all_bits = np.uint32(1) << np.random.randint(
+            0, 7, (num_steps, k)
+        ).astype(np.uint32)
+        all_chars = np.random.randint(32, 127, (num_steps, k)).astype(
+            np.uint32
+        )
+        num_active = np.count_nonzero(
+            stacks > np.arange(num_steps)[:, None], axis=1
+        ).tolist()
+        for step, n in enumerate(num_active):
+            rows = np.arange(n)
+            ops = all_ops[step, :n]
+            ops[lengths[:n] == 0] = self.INSERT
+            insert = ops == self.INSERT
+            delete = ops == self.DELETE
+            flip = ops == self.FLIP
+            pos = (all_pos[step, :n] * (lengths[:n] + insert)).astype(np.intp)
+
+            buffer[rows[flip], pos[flip]] ^= all_bits[step, :n][flip]
+
+            shifted[:n, 1:] = buffer[:n, :-1]
+            np.greater(columns, pos[:, None], out=mask[:n])
+            mask[:n] &= insert[:, None]
+            np.copyto(buffer[:n], shifted[:n], where=mask[:n])
+            buffer[rows[insert], pos[insert]] = all_chars[step, :n][insert]
+
+            shifted[:n, :-1] = buffer[:n, 1:]
+            np.greater_equal(columns, pos[:, None], out=mask[:n])
+            mask[:n] &= delete[:, None]
+            np.copyto(buffer[:n], shifted[:n], where=mask[:n])
+
+            lengths[:n] += insert
+            lengths[:n] -= delete
+        mutants = [
+            buffer[row, :length].tobytes().decode("utf-32-le", "surrogatepass")
+            for row, length in enumerate(lengths.tolist())
+        ]
+        return [mutants[row] for row in np.argsort(order).tolist()]
+
 
 class PowerSchedule:
+    # Key of a `Seed.coverage`, matching the coverage keys of executions
+    # given to `observe`; fuzzers with other keys set their own
+    encode_coverage = frozenset
+
     def assign_energy(self, population):
         for seed in population:
             seed.energy = 1
@@ -59,6 +182,155 @@ class PowerSchedule:
         norm_energy = self.normalized_energy(population)
         return random.choices(population, weights=norm_energy)[0]
 
+    def observe(self, population, key) -> None:
+        # Called with the coverage key of every execution; ignored by
+        # default, and then not called by `GreyboxFuzzer` at all
+        pass
+
+
+class FenwickTree:
+    """Prefix sums over `n` non-negative weights.
+
+    Updating a weight and finding the index at a given prefix sum both
+    take O(log n); `append` is amortized O(log n).
+    """
+
+    def __init__(self, weights=()) -> None:
+        self._build(list(weights))
+
+    def _build(self, weights) -> None:
+        self.weights = []
+        self._tree = [0.0]
+        self._updates = 0
+        for weight in weights:
+            self.append(weight)
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    def append(self, weight) -> None:
+        self.weights.append(weight)
+        index = len(self.weights)
+        # The new node covers (index - lowbit(index), index]
+        total = weight
+        child = index - 1
+        stop = index - (index & -index)
+        while child > stop:
+            total += self._tree[child]
+            child -= child & -child
+        self._tree.append(total)
+
+    def update(self, index, weight) -> None:
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        self._updates += 1
+        if self._updates > len(self.weights):
+            # Rebuild now and then so float errors do not pile up
+            self._build(self.weights)
+            return
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def total(self) -> float:
+        total = 0.0
+        index = len(self.weights)
+        while index:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, value) -> int:
+        """The first index whose prefix sum exceeds `value`."""
+        index = 0
+        step = 1 << len(self.weights).bit_length()
+        while step:
+            if index + step < len(self._tree) and (
+                self._tree[index + step] <= value
+            ):
+                index += step
+                value -= self._tree[index]
+            step >>= 1
+        return min(index, len(self.weights) - 1)
+
+
+class AFLFastSchedule(PowerSchedule):
+    """AFLFast's coverage-aware power schedules.
+
+    The energy of a seed depends on `f`, the number of executions that
+    exercised its path (`Seed.coverage`), and `s`, the number of times the
+    seed was chosen:
+
+    - `"exp"`: `2 ** s / f`, AFLFast's exponential schedule.
+    - `"freq"`: `1 / f ** exponent`, favoring rarely exercised paths.
+
+    Energies are capped at `max_energy` and kept in a `FenwickTree`, so
+    `choose` is O(log n). Seeds appended to the population are picked up
+    on the next `choose`.
+    """
+
+    def __init__(self, schedule="exp", exponent=5, max_energy=2**16) -> None:
+        if schedule not in ("exp", "freq"):
+            raise ValueError(f"Unknown schedule {schedule!r}")
+        self.schedule = schedule
+        self.exponent = exponent
+        self.max_energy = max_energy
+        self.path_frequency = {}
+        self._population = None
+        self._tree = FenwickTree()
+        self._seed_paths = []
+        self._path_seeds = {}
+
+    def energy(self, frequency, chosen) -> float:
+        frequency = max(frequency, 1)
+        if self.schedule == "exp":
+            energy = 2.0 ** min(chosen, 64) / frequency
+        else:
+            energy = 1.0 / frequency**self.exponent
+        return min(energy, self.max_energy)
+
+    def _seed_energy(self, index) -> float:
+        path = self._seed_paths[index]
+        return self.energy(
+            self.path_frequency.get(path, 0), self._population[index].chosen
+        )
+
+    def _sync(self, population) -> None:
+        if population is not self._population or len(population) < len(
+            self._tree
+        ):
+            self._population = population
+            self._tree = FenwickTree()
+            self._seed_paths = []
+            self._path_seeds = {}
+        for index in range(len(self._tree), len(population)):
+            seed = population[index]
+            seed.chosen = getattr(seed, "chosen", 0)
+            coverage = getattr(seed, "coverage", None)
+            path = None if coverage is None else self.encode_coverage(coverage)
+            self._seed_paths.append(path)
+            self._path_seeds.setdefault(path, []).append(index)
+            self._tree.append(self._seed_energy(index))
+
+    def assign_energy(self, population):
+        self._sync(population)
+        for seed, energy in zip(population, self._tree.weights):
+            seed.energy = energy
+
+    def choose(self, population):
+        self._sync(population)
+        index = self._tree.find(random.random() * self._tree.total())
+        population[index].chosen += 1
+        self._tree.update(index, self._seed_energy(index))
+        return population[index]
+
+    def observe(self, population, key) -> None:
+        self.path_frequency[key] = self.path_frequency.get(key, 0) + 1
+        if population is self._population:
+            for index in self._path_seeds.get(key, ()):
+                self._tree.update(index, self._seed_energy(index))
+
 
 class Seed:
     def __init__(self, data) -> None:
@@ -71,6 +343,9 @@ class Seed:
 
 
 class MutationFuzzer(Fuzzer):
+    # A `Stats.Stats` to instrument fuzzing with
+    stats = NULL_STATS
+
     def __init__(
         self, seeds: List, mutator: Mutator, schedule: PowerSchedule
     ) -> None:
@@ -83,15 +358,16 @@ class MutationFuzzer(Fuzzer):
     def reset(self):
         self.population = [Seed(x) for x in self.seeds]
         self.seed_index = 0
+        self._candidates = []
 
     def create_candidate(self):
-        seed = self.schedule.choose(self.population)
-
-        candidate = seed.data
-        trials = min(len(candidate), 1 << random.randint(1, 5))
-        for _ in range(trials):
-            candidate = self.mutator.mutate(candidate)
-        return candidate
+        if not self._candidates:
+            seed = self.schedule.choose(self.population)
+            self._candidates = self.mutator.havoc(
+                seed.data, self.mutator.batch_size
+            )
+            self._candidates.reverse()
+        return self._candidates.pop()
 
     def fuzz(self):
         if self.seed_index < len(self.seeds):
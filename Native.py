@@ -0,0 +1,317 @@
+import ctypes
+import hashlib
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+
+from Fuzzer import Runner
+
+# Records basic blocks (gcc's -fsanitize-coverage=trace-pc) and function
+# entries and exits (-finstrument-functions) as (kind, address) pairs
+_RUNTIME_SOURCE = r"""
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <stddef.h>
+#include <stdint.h>
+
+enum { EVENT_PC, EVENT_ENTER, EVENT_EXIT };
+
+static uint64_t *trace_events;
+static size_t trace_capacity;
+static size_t trace_length;
+
+void trace_set_buffer(uint64_t *events, size_t capacity)
+{
+  trace_events = events;
+  trace_capacity = capacity;
+  trace_length = 0;
+}
+
+size_t trace_size(void)
+{
+  return trace_length;
+}
+
+uint64_t trace_base(void)
+{
+  Dl_info info;
+  dladdr((void *)trace_base, &info);
+  return (uint64_t)info.dli_fbase;
+}
+
+static inline void trace_event(uint64_t kind, void *address)
+{
+  if (trace_length < trace_capacity)
+  {
+    trace_events[2 * trace_length] = kind;
+    trace_events[2 * trace_length + 1] = (uint64_t)address;
+  }
+  trace_length++;
+}
+
+void __sanitizer_cov_trace_pc(void)
+{
+  trace_event(EVENT_PC, __builtin_return_address(0));
+}
+
+void __cyg_profile_func_enter(void *function, void *call_site)
+{
+  trace_event(EVENT_ENTER, function);
+}
+
+void __cyg_profile_func_exit(void *function, void *call_site)
+{
+  trace_event(EVENT_EXIT, function);
+}
+"""
+
+EVENT_PC, EVENT_ENTER, EVENT_EXIT = range(3)
+
+COVERAGE_FLAGS = [
+    "-O0",
+    "-g",
+    "-fsanitize-coverage=trace-pc",
+    "-finstrument-functions",
+]
+
+
+def build_library(sources, harness=(), cc="gcc", build_dir=None):
+    """Compile a shared library tracing the functions of `sources`.
+
+    `harness` sources are linked in without instrumentation. Libraries are
+    cached in `build_dir` (a directory under the system temporary
+    directory by default) by a digest of the sources and flags.
+    """
+    digest = hashlib.sha256(_RUNTIME_SOURCE.encode())
+    for flag in [cc] + COVERAGE_FLAGS:
+        digest.update(flag.encode())
+    for path in list(sources) + ["--"] + list(harness):
+        digest.update(path.encode())
+        if path != "--":
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    if build_dir is None:
+        build_dir = os.path.join(tempfile.gettempdir(), "native-targets")
+    build_dir = os.path.join(build_dir, digest.hexdigest()[:16])
+    library = os.path.join(build_dir, "target.so")
+    if os.path.exists(library):
+        return library
+    os.makedirs(build_dir, exist_ok=True)
+    runtime = os.path.join(build_dir, "runtime.c")
+    with open(runtime, "w") as f:
+        f.write(_RUNTIME_SOURCE)
+    objects = []
+
+    def compile_object(source, flags):
+        obj = os.path.join(build_dir, f"{len(objects)}.o")
+        subprocess.run(
+            [cc, "-c", "-fPIC", *flags, source, "-o", obj], check=True
+        )
+        objects.append(obj)
+
+    compile_object(runtime, ["-O2"])
+    for source in harness:
+        compile_object(source, ["-O2"])
+    for source in sources:
+        compile_object(source, COVERAGE_FLAGS)
+    # Link under a temporary name, so a concurrent build never loads a
+    # partial library
+    partial = library + f".{os.getpid()}"
+    subprocess.run(
+        [cc, "-shared", *objects, "-o", partial, "-ldl"], check=True
+    )
+    os.replace(partial, library)
+    return library
+
+
+class NativeContCovRunner(Runner):
+    """Runs a C function in-process and traces it like `ContCov`.
+
+    The target is compiled by `build_library` and loaded with ctypes;
+    `entry` is called as `int entry(const char *data, size_t size)` with
+    the UTF-8 encoded input, and its return value is the result. Basic
+    blocks are mapped to `(function, line)` of their first line with
+    `addr2line`, and labeled with their call stack as by `ContCov`, so
+    records of native targets feed `Graph` and `ControlFlowModel` as is.
+
+    A crash or hang in the target takes the runner down; wrap it in a
+    `ForkServer.ForkServerRunner` for untrusted inputs. Copies of the
+    runner share the loaded library, so they must not run concurrently in
+    one process.
+    """
+
+    def __init__(
+        self,
+        sources,
+        entry,
+        harness=(),
+        trace_size=1 << 20,
+        cc="gcc",
+        build_dir=None,
+    ) -> None:
+        self.sources = list(sources)
+        self.entry = entry
+        self.harness = list(harness)
+        self.trace_size = trace_size
+        self.cc = cc
+        self.build_dir = build_dir
+        self._load()
+
+    def _load(self) -> None:
+        self.library_path = build_library(
+            self.sources, self.harness, self.cc, self.build_dir
+        )
+        self._library = ctypes.CDLL(self.library_path)
+        self._entry = getattr(self._library, self.entry)
+        self._entry.argtypes = [ctypes.c_char_p, ctypes.c_size_t]
+        self._entry.restype = ctypes.c_int
+        self._library.trace_size.restype = ctypes.c_size_t
+        self._library.trace_base.restype = ctypes.c_uint64
+        self._base = self._library.trace_base()
+        self._events = np.zeros(2 * self.trace_size, dtype=np.uint64)
+        self._events_pointer = self._events.ctypes.data_as(ctypes.c_void_p)
+        # address -> (function, line) of a block, or None outside the
+        # traced sources; address -> name of a function
+        self._lines = {}
+        self._functions = {}
+        self._num_events = 0
+        self._trace = None
+
+    def __getstate__(self):
+        return {
+            "sources": self.sources,
+            "entry": self.entry,
+            "harness": self.harness,
+            "trace_size": self.trace_size,
+            "cc": self.cc,
+            "build_dir": self.build_dir,
+        }
+
+    def __setstate__(self, state) -> None:
+        self.__dict__.update(state)
+        self._load()
+
+    def run(self, inp):
+        data = inp.encode("utf-8", "surrogatepass")
+        self._library.trace_set_buffer(
+            self._events_pointer, ctypes.c_size_t(self.trace_size)
+        )
+        result = self._entry(data, len(data))
+        self._num_events = self._library.trace_size()
+        if self._num_events > self.trace_size:
+            raise RuntimeError(
+                "The trace does not fit into the trace buffer; "
+                "increase trace_size."
+            )
+        self._trace = None
+        return result, self.PASS
+
+    def _resolve(self, addresses, table, offset=0) -> None:
+        # Look up new addresses with one addr2line call
+        addresses = [
+            address for address in set(addresses) if address not in table
+        ]
+        if not addresses:
+            return
+        output = subprocess.run(
+            ["addr2line", "-f", "-e", self.library_path]
+            + [hex(address - self._base - offset) for address in addresses],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.splitlines()
+        for address, function, location in zip(
+            addresses, output[::2], output[1::2]
+        ):
+            lineno = location.split(" ")[0].rsplit(":", 1)[-1]
+            if function == "??" or not lineno.isdigit() or lineno == "0":
+                table[address] = None
+            elif table is self._functions:
+                table[address] = function
+            else:
+                table[address] = (function, int(lineno))
+
+    def trace(self):
+        if self._trace is not None:
+            return self._trace
+        events = self._events[: 2 * self._num_events].reshape(-1, 2).tolist()
+        pcs = [address for kind, address in events if kind == EVENT_PC]
+        functions = [address for kind, address in events if kind != EVENT_PC]
+        # A return address points past the call into the block
+        self._resolve(pcs, self._lines, offset=1)
+        self._resolve(functions, self._functions)
+        trace = []
+        call_stack = []
+        call_context = ""
+        prev_lineno = 0
+        for kind, address in events:
+            if kind == EVENT_PC:
+                line = self._lines[address]
+                if line is not None:
+                    trace.append((call_context, line))
+                    prev_lineno = line[1]
+            elif kind == EVENT_ENTER:
+                if call_stack:
+                    # Update calling context
+                    call_stack[-1] = (
+                        f"{call_stack[-1].split(':')[0]}:{prev_lineno}"
+                    )
+                call_stack.append(self._functions[address])
+                call_context = "-".join(call_stack[:-1])
+            elif call_stack:
+                call_stack.pop()
+                call_context = "-".join(call_stack[:-1])
+        self._trace = trace
+        return trace
+
+    def coverage(self):
+        return set(self.trace())
+
+
+CGI_DECODE_DIR = os.path.join(
+    os.path.dirname(__file__), "example", "cgidecode"
+)
+
+
+def cgi_decode_runner(**kwargs):
+    """A `NativeContCovRunner` for `example/cgidecode/cgi_decode.c`."""
+    return NativeContCovRunner(
+        [os.path.join(CGI_DECODE_DIR, "cgi_decode.c")],
+        "cgi_decode_fuzz",
+        harness=[os.path.join(CGI_DECODE_DIR, "cgi_decode_fuzz.c")],
+        **kwargs,
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    from ControlFlowModel import ControlFlowModel
+    from graph import Graph
+    from GreyboxFuzzer import GreyboxFuzzerRecorder
+    from MutationFuzzer import Mutator, PowerSchedule
+
+    n = 20000
+    runner = cgi_decode_runner()
+    recorder = GreyboxFuzzerRecorder(
+        ["Hello+World", "%41%42", "abc%zz"], Mutator(), PowerSchedule()
+    )
+    start = time.time()
+    recorder.runs(runner, trials=n)
+    end = time.time()
+    record = recorder.get_record()
+    print(
+        f"Fuzzing cgi_decode took {end - start:.2f} seconds for {n} inputs "
+        f"({n / (end - start):.0f} execs/sec); {len(record)} unique paths."
+    )
+
+    contcov_graph, coverage_graph = Graph(), Graph()
+    for path in record:
+        contcov_graph.accept(path)
+        coverage_graph.accept([contcov[1] for contcov in path])
+    model = ControlFlowModel(record, contcov_graph, coverage_graph, runner)
+    model.identify_branch()
+    model.model_context(mut_trial=5)
+    model.model_condition(exact=True)
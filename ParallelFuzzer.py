@@ -0,0 +1,222 @@
+import multiprocessing
+import os
+import pickle
+import random
+import time
+import traceback
+
+from Coverage import FunctionContCovRunner
+from example.python.crash import crashme3_tup
+from GreyboxFuzzer import GreyboxFuzzerRecorder
+from MutationFuzzer import Mutator, PowerSchedule
+
+
+def merge_records(records, max_inputs=10):
+    """Merge `cov_record`s of several recorders into one.
+
+    Paths keep the order in which they first appear in `records`; each path
+    keeps at most `max_inputs` inputs, taken from the records in order and
+    from each record in sorted order, so the merge does not depend on the
+    iteration order of the input sets.
+    """
+    merged = {}
+    for record in records:
+        for path, inputs in record.items():
+            if path not in merged:
+                merged[path] = set()
+            for inp in sorted(inputs):
+                if len(merged[path]) >= max_inputs:
+                    break
+                merged[path].add(inp)
+    return merged
+
+
+class _WorkerError:
+    # Sent instead of a reply by a worker that raised
+    def __init__(self, exc) -> None:
+        self.traceback = traceback.format_exc()
+        try:
+            self.exc = pickle.loads(pickle.dumps(exc))
+        except Exception:
+            self.exc = None
+
+
+def _fuzz_worker(conn, fuzzer, runner, seed):
+    try:
+        random.seed(seed)
+        # The fuzzer comes with the parent's executions; send only new ones
+        num_inputs = len(fuzzer.inputs)
+        results = []
+        while True:
+            trials, shared_seeds = conn.recv()
+            if trials is None:
+                break
+            for shared_seed in shared_seeds:
+                coverage = fuzzer.encode_coverage(shared_seed.coverage)
+                if coverage not in fuzzer.coverages_seen:
+                    fuzzer.coverages_seen.add(coverage)
+                    fuzzer.population.append(shared_seed)
+            known = len(fuzzer.population)
+            results.extend(fuzzer.runs(runner, trials))
+            conn.send(fuzzer.population[known:])
+        conn.send((fuzzer.get_record(), fuzzer.inputs[num_inputs:], results))
+    except Exception as exc:
+        conn.send(_WorkerError(exc))
+    finally:
+        conn.close()
+
+
+class ParallelFuzzerRecorder:
+    """Runs copies of a `GreyboxFuzzerRecorder` in worker processes.
+
+    The initial seeds are run once, by `fuzzer` in the parent, and the
+    workers start from its state. Every `sync_interval` trials, each
+    worker sends the seeds it found to the parent, which adds the ones with
+    unseen coverage to the shared `population` and forwards them to the
+    other workers. So `population` is laid out as that of the serial
+    fuzzer: the initial seeds, then the seeds found. `runs` returns the
+    results of the seeds, then those of each worker in turn, matching
+    `inputs`. Worker `i` seeds its RNG with `seed + i`, so a campaign is
+    reproducible for a fixed number of workers. If a worker raises or
+    dies, the others are terminated and `runs` raises a `RuntimeError`.
+    """
+
+    def __init__(
+        self,
+        fuzzer: GreyboxFuzzerRecorder,
+        workers=None,
+        sync_interval=500,
+        seed=0,
+    ) -> None:
+        self.fuzzer = fuzzer
+        self.workers = workers or os.cpu_count()
+        self.sync_interval = sync_interval
+        self.seed = seed
+        self.population = list(fuzzer.population)
+        self.coverages_seen = set()
+        self.inputs = []
+        self.cov_record = {}
+        self.execs_per_sec = None
+
+    def _share(self, found):
+        outgoing = [[] for _ in found]
+        for worker_id, seeds in enumerate(found):
+            for seed in seeds:
+                coverage = frozenset(seed.coverage)
+                if coverage in self.coverages_seen:
+                    continue
+                self.coverages_seen.add(coverage)
+                self.population.append(seed)
+                for other_id, other in enumerate(outgoing):
+                    if other_id != worker_id:
+                        other.append(seed)
+        return outgoing
+
+    def _stop(self, procs, worker_id, error=None):
+        # Terminate all workers after worker `worker_id` raised or died
+        for proc in procs:
+            proc.terminate()
+            proc.join()
+        if error is None:
+            raise RuntimeError(
+                f"Fuzzing worker {worker_id} died with exit code "
+                f"{procs[worker_id].exitcode}."
+            )
+        raise RuntimeError(
+            f"Fuzzing worker {worker_id} failed:\n{error.traceback}"
+        ) from error.exc
+
+    def _send(self, conns, procs, messages):
+        for worker_id, (conn, message) in enumerate(zip(conns, messages)):
+            try:
+                conn.send(message)
+            except (BrokenPipeError, ConnectionResetError):
+                self._stop(procs, worker_id)
+
+    def _receive(self, conns, procs):
+        replies = []
+        for worker_id, conn in enumerate(conns):
+            try:
+                reply = conn.recv()
+            except (EOFError, ConnectionResetError):
+                self._stop(procs, worker_id)
+            if isinstance(reply, _WorkerError):
+                self._stop(procs, worker_id, reply)
+            replies.append(reply)
+        return replies
+
+    def runs(self, runner, trials=10):
+        start = time.time()
+        # Run the initial seeds once, here, rather than once per worker
+        num_seeds = min(
+            trials, len(self.fuzzer.seeds) - self.fuzzer.seed_index
+        )
+        known = len(self.fuzzer.population)
+        num_inputs = len(self.fuzzer.inputs)
+        seed_results = self.fuzzer.runs(runner, num_seeds)
+        trials -= num_seeds
+        self.inputs.extend(self.fuzzer.inputs[num_inputs:])
+        # The workers start with the seeds found by the parent's fuzzer,
+        # but not with those found by workers in earlier `runs`
+        earlier = self.population[known:]
+        self._share([self.fuzzer.population[known:]])
+        outgoing = [list(earlier) for _ in range(self.workers)]
+
+        quota = [
+            trials // self.workers + (worker_id < trials % self.workers)
+            for worker_id in range(self.workers)
+        ]
+        conns, procs = [], []
+        for worker_id in range(self.workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            proc = multiprocessing.Process(
+                target=_fuzz_worker,
+                args=(child_conn, self.fuzzer, runner, self.seed + worker_id),
+            )
+            proc.start()
+            # Only the worker holds its end, so its death ends the pipe
+            child_conn.close()
+            conns.append(parent_conn)
+            procs.append(proc)
+
+        while any(quota):
+            batch = [min(self.sync_interval, left) for left in quota]
+            self._send(conns, procs, zip(batch, outgoing))
+            quota = [left - done for left, done in zip(quota, batch)]
+            outgoing = self._share(self._receive(conns, procs))
+
+        self._send(conns, procs, [(None, None)] * len(conns))
+        results = self._receive(conns, procs)
+        for proc in procs:
+            proc.join()
+
+        self.cov_record = merge_records(
+            [self.cov_record, self.fuzzer.get_record()]
+            + [record for record, _, _ in results],
+            self.fuzzer.max_inputs,
+        )
+        all_results = seed_results
+        for _, inputs, worker_results in results:
+            self.inputs.extend(inputs)
+            all_results.extend(worker_results)
+        self.execs_per_sec = len(all_results) / (time.time() - start)
+        return all_results
+
+    def get_record(self):
+        return self.cov_record
+
+
+if __name__ == "__main__":
+    n = 30000
+    program, seed_input_list = crashme3_tup
+    for workers in [1, os.cpu_count()]:
+        parallel_fuzzer = ParallelFuzzerRecorder(
+            GreyboxFuzzerRecorder(seed_input_list, Mutator(), PowerSchedule()),
+            workers=workers,
+        )
+        parallel_fuzzer.runs(FunctionContCovRunner(program), trials=n)
+        print(
+            f"{workers} worker(s): {parallel_fuzzer.execs_per_sec:.0f} execs/sec, "
+            f"{len(parallel_fuzzer.get_record())} unique paths, "
+            f"{len(parallel_fuzzer.population)} seeds."
+        )
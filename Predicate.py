@@ -0,0 +1,494 @@
+import json
+import operator
+from random import choice, randint
+
+import numpy as np
+
+OP_STRS = {
+    operator.eq: "==",
+    operator.le: "<=",
+    operator.ge: ">=",
+    operator.ne: "!=",
+    operator.lt: "<",
+    operator.gt: ">",
+}
+STR_OPS = {op_str: op for op, op_str in OP_STRS.items()}
+
+NEGATED_OPS = {
+    operator.eq: operator.ne,
+    operator.ne: operator.eq,
+    operator.le: operator.gt,
+    operator.gt: operator.le,
+    operator.ge: operator.lt,
+    operator.lt: operator.ge,
+}
+
+
+def _choose_code(lo, hi):
+    # A random code point in [lo, hi], printable ASCII if possible
+    lo, hi = max(lo, 0), min(hi, 0x10FFFF)
+    if lo > hi:
+        return None
+    if lo <= 126 and hi >= 32:
+        return randint(max(lo, 32), min(hi, 126))
+    return randint(lo, hi)
+
+
+def _satisfying_code(op, val):
+    # A code point c with op(c, val)
+    if op == operator.eq:
+        return val
+    if op == operator.ne:
+        code = _choose_code(32, 125)
+        return code + 1 if code >= val else code
+    if op in (operator.lt, operator.le):
+        return _choose_code(0, val - (op == operator.lt))
+    return _choose_code(val + (op == operator.gt), 0x10FFFF)
+
+
+def _resize(inp, size):
+    # Cut `inp` to `size`, or pad it with random printable characters
+    pad = "".join(chr(randint(32, 126)) for _ in range(size - len(inp)))
+    return inp[:size] + pad
+
+
+def _set_char(inp, pos, code):
+    if code is None:
+        return None
+    return inp[:pos] + chr(code) + inp[pos + 1 :]
+
+
+class Predicate:
+    """A predicate over input strings, as a small AST.
+
+    A predicate is called on one input, evaluated on a whole pool with
+    `evaluate`, printed as the formula string `lambda x: ...`, and
+    round-trips through `to_json` and `from_json`. Position predicates
+    reject inputs too short for them. Predicates are immutable, compare
+    by structure and pickle.
+    """
+
+    __slots__ = ()
+    kind = None
+    # Index of the comparison operator in `args`, if any
+    op_arg = None
+
+    def __call__(self, inp) -> bool:
+        raise NotImplementedError
+
+    def evaluate(self, matrix, lengths) -> np.ndarray:
+        """The predicate on every row of an `encode_inputs` matrix."""
+        raise NotImplementedError
+
+    def negate(self) -> "Predicate":
+        """The predicate accepting exactly what this one rejects.
+
+        A position predicate negates to the opposite comparison, which
+        still rejects inputs too short for it, so its negation is only
+        exact for inputs long enough. Compound predicates are negated
+        exactly.
+        """
+        raise NotImplementedError
+
+    def positions(self):
+        # Input positions read by the predicate
+        return ()
+
+    def satisfy(self, inp, offset=0):
+        """Edit `inp` so that `inp[offset:]` satisfies the predicate.
+
+        Sets one character, after padding `inp` with random characters
+        if it is too short, or cuts or pads `inp` for a length predicate.
+        Returns None if no such edit exists. A conjunction is satisfied
+        one predicate after the other, a disjunction through a random one
+        of its predicates.
+        """
+        raise NotImplementedError
+
+    def expr(self) -> str:
+        # The body of the formula string
+        raise NotImplementedError
+
+    def args(self):
+        # The constructor arguments
+        raise NotImplementedError
+
+    def to_json(self):
+        """A JSON-compatible list from which `from_json` rebuilds this."""
+        args = list(self.args())
+        if self.op_arg is not None:
+            args[self.op_arg] = OP_STRS[args[self.op_arg]]
+        return [self.kind] + args
+
+    @staticmethod
+    def from_json(data) -> "Predicate":
+        cls = PREDICATE_KINDS[data[0]]
+        if cls in (And, Or):
+            return cls(map(Predicate.from_json, data[1]))
+        if cls is Not:
+            return Not(Predicate.from_json(data[1]))
+        args = list(data[1:])
+        if cls.op_arg is not None:
+            args[cls.op_arg] = STR_OPS[args[cls.op_arg]]
+        return cls(*args)
+
+    def dumps(self) -> str:
+        return json.dumps(self.to_json())
+
+    @staticmethod
+    def loads(s) -> "Predicate":
+        return Predicate.from_json(json.loads(s))
+
+    def __str__(self) -> str:
+        return f"lambda x: {self.expr()}"
+
+    def __repr__(self) -> str:
+        args = list(map(repr, self.args()))
+        if self.op_arg is not None:
+            args[self.op_arg] = f"operator.{self.args()[self.op_arg].__name__}"
+        return f"{type(self).__name__}({', '.join(args)})"
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and self.args() == other.args()
+
+    def __hash__(self) -> int:
+        return hash((self.kind, self.args()))
+
+    def __reduce__(self):
+        return type(self), self.args()
+
+
+class Length(Predicate):
+    """`len(x) op size`."""
+
+    __slots__ = ("op", "size")
+    kind = "len"
+    op_arg = 0
+
+    def __init__(self, op, size) -> None:
+        self.op = op
+        self.size = size
+
+    def args(self):
+        return (self.op, self.size)
+
+    def __call__(self, inp) -> bool:
+        return self.op(len(inp), self.size)
+
+    def evaluate(self, matrix, lengths) -> np.ndarray:
+        return self.op(lengths, self.size)
+
+    def negate(self) -> Predicate:
+        return Length(NEGATED_OPS[self.op], self.size)
+
+    def satisfy(self, inp, offset=0):
+        op, size = self.op, self.size
+        if op == operator.eq:
+            target = size
+        elif op == operator.ne:
+            target = size + 1 if size == 0 or randint(0, 1) else size - 1
+        elif op in (operator.lt, operator.le):
+            if size - (op == operator.lt) < 0:
+                return None
+            target = randint(max(size - 3, 0), size - (op == operator.lt))
+        else:
+            target = randint(size + (op == operator.gt), size + 3)
+        return _resize(inp, offset + target)
+
+    def expr(self) -> str:
+        return f"len(x) {OP_STRS[self.op]} {self.size}"
+
+
+class PositionPredicate(Predicate):
+    """A comparison of the character at `pos` with a constant."""
+
+    __slots__ = ("pos",)
+
+    def positions(self):
+        return (self.pos,)
+
+    def __call__(self, inp) -> bool:
+        return len(inp) > self.pos and self.compare(inp[self.pos])
+
+    def evaluate(self, matrix, lengths) -> np.ndarray:
+        if self.pos >= matrix.shape[1]:
+            return np.zeros(len(lengths), dtype=bool)
+        return self.compare_codes(matrix[:, self.pos]) & (lengths > self.pos)
+
+    def satisfy(self, inp, offset=0):
+        pos = offset + self.pos
+        inp = _resize(inp, max(len(inp), pos + 1))
+        return _set_char(inp, pos, self.satisfying_code())
+
+    def compare(self, char) -> bool:
+        raise NotImplementedError
+
+    def compare_codes(self, codes) -> np.ndarray:
+        raise NotImplementedError
+
+    def satisfying_code(self):
+        # A code point to put at `pos`, or None if there is none
+        raise NotImplementedError
+
+
+class Unary(PositionPredicate):
+    """`x[pos] op char`."""
+
+    __slots__ = ("op", "char")
+    kind = "unary"
+    op_arg = 1
+
+    def __init__(self, pos, op, char) -> None:
+        self.pos = pos
+        self.op = op
+        self.char = char
+
+    def args(self):
+        return (self.pos, self.op, self.char)
+
+    def compare(self, char) -> bool:
+        return self.op(char, self.char)
+
+    def compare_codes(self, codes) -> np.ndarray:
+        return self.op(codes, ord(self.char))
+
+    def negate(self) -> Predicate:
+        return Unary(self.pos, NEGATED_OPS[self.op], self.char)
+
+    def satisfying_code(self):
+        return _satisfying_code(self.op, ord(self.char))
+
+    def expr(self) -> str:
+        return f"x[{self.pos}] {OP_STRS[self.op]} {self.char!r}"
+
+
+class InRange(PositionPredicate):
+    """`lo <= x[pos] <= hi`."""
+
+    __slots__ = ("lo", "hi")
+    kind = "in_range"
+
+    def __init__(self, pos, lo, hi) -> None:
+        self.pos = pos
+        self.lo = lo
+        self.hi = hi
+
+    def args(self):
+        return (self.pos, self.lo, self.hi)
+
+    def compare(self, char) -> bool:
+        return self.lo <= char <= self.hi
+
+    def compare_codes(self, codes) -> np.ndarray:
+        return (codes >= ord(self.lo)) & (codes <= ord(self.hi))
+
+    def negate(self) -> Predicate:
+        return OutRange(self.pos, self.lo, self.hi)
+
+    def satisfying_code(self):
+        return _choose_code(ord(self.lo), ord(self.hi))
+
+    def expr(self) -> str:
+        return f"{self.lo!r} <= x[{self.pos}] <= {self.hi!r}"
+
+
+class OutRange(PositionPredicate):
+    """`x[pos] < lo or x[pos] > hi`."""
+
+    __slots__ = ("lo", "hi")
+    kind = "out_range"
+
+    def __init__(self, pos, lo, hi) -> None:
+        self.pos = pos
+        self.lo = lo
+        self.hi = hi
+
+    def args(self):
+        return (self.pos, self.lo, self.hi)
+
+    def compare(self, char) -> bool:
+        return char < self.lo or char > self.hi
+
+    def compare_codes(self, codes) -> np.ndarray:
+        return (codes < ord(self.lo)) | (codes > ord(self.hi))
+
+    def negate(self) -> Predicate:
+        return InRange(self.pos, self.lo, self.hi)
+
+    def satisfying_code(self):
+        codes = [
+            code
+            for code in (
+                _choose_code(0, ord(self.lo) - 1),
+                _choose_code(ord(self.hi) + 1, 0x10FFFF),
+            )
+            if code is not None
+        ]
+        return choice(codes) if codes else None
+
+    def expr(self) -> str:
+        return f"x[{self.pos}] < {self.lo!r} or x[{self.pos}] > {self.hi!r}"
+
+
+class Binary(Predicate):
+    """`x[pos1] op x[pos2]`."""
+
+    __slots__ = ("pos1", "op", "pos2")
+    kind = "binary"
+    op_arg = 1
+
+    def __init__(self, pos1, op, pos2) -> None:
+        self.pos1 = pos1
+        self.op = op
+        self.pos2 = pos2
+
+    def args(self):
+        return (self.pos1, self.op, self.pos2)
+
+    def positions(self):
+        return (self.pos1, self.pos2)
+
+    def __call__(self, inp) -> bool:
+        return len(inp) > max(self.pos1, self.pos2) and self.op(
+            inp[self.pos1], inp[self.pos2]
+        )
+
+    def evaluate(self, matrix, lengths) -> np.ndarray:
+        pos = max(self.pos1, self.pos2)
+        if pos >= matrix.shape[1]:
+            return np.zeros(len(lengths), dtype=bool)
+        result = self.op(matrix[:, self.pos1], matrix[:, self.pos2])
+        return result & (lengths > pos)
+
+    def negate(self) -> Predicate:
+        return Binary(self.pos1, NEGATED_OPS[self.op], self.pos2)
+
+    def satisfy(self, inp, offset=0):
+        inp = _resize(inp, max(len(inp), offset + max(self.positions()) + 1))
+        code = _satisfying_code(self.op, ord(inp[offset + self.pos2]))
+        return _set_char(inp, offset + self.pos1, code)
+
+    def expr(self) -> str:
+        return f"x[{self.pos1}] {OP_STRS[self.op]} x[{self.pos2}]"
+
+
+class Compound(Predicate):
+    """A conjunction or disjunction of `children`."""
+
+    __slots__ = ("children",)
+
+    def __init__(self, children) -> None:
+        self.children = tuple(children)
+
+    def args(self):
+        return (self.children,)
+
+    def to_json(self):
+        return [self.kind, [child.to_json() for child in self.children]]
+
+    def positions(self):
+        return tuple(
+            sorted(
+                {pos for child in self.children for pos in child.positions()}
+            )
+        )
+
+    def negate(self) -> Predicate:
+        return Not(self)
+
+    def expr(self) -> str:
+        return f" {self.kind} ".join(
+            (
+                f"({child.expr()})"
+                if isinstance(child, (Compound, OutRange))
+                else child.expr()
+            )
+            for child in self.children
+        )
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self.children)!r})"
+
+
+class And(Compound):
+    __slots__ = ()
+    kind = "and"
+
+    def __call__(self, inp) -> bool:
+        return all(child(inp) for child in self.children)
+
+    def evaluate(self, matrix, lengths) -> np.ndarray:
+        return np.logical_and.reduce(
+            [child.evaluate(matrix, lengths) for child in self.children]
+        )
+
+    def satisfy(self, inp, offset=0):
+        for child in self.children:
+            inp = child.satisfy(inp, offset)
+            if inp is None:
+                return None
+        return inp
+
+
+class Or(Compound):
+    __slots__ = ()
+    kind = "or"
+
+    def __call__(self, inp) -> bool:
+        return any(child(inp) for child in self.children)
+
+    def evaluate(self, matrix, lengths) -> np.ndarray:
+        return np.logical_or.reduce(
+            [child.evaluate(matrix, lengths) for child in self.children]
+        )
+
+    def satisfy(self, inp, offset=0):
+        return choice(self.children).satisfy(inp, offset)
+
+
+class Not(Predicate):
+    """`not child`."""
+
+    __slots__ = ("child",)
+    kind = "not"
+
+    def __init__(self, child) -> None:
+        self.child = child
+
+    def args(self):
+        return (self.child,)
+
+    def to_json(self):
+        return [self.kind, self.child.to_json()]
+
+    def positions(self):
+        return self.child.positions()
+
+    def __call__(self, inp) -> bool:
+        return not self.child(inp)
+
+    def evaluate(self, matrix, lengths) -> np.ndarray:
+        return ~self.child.evaluate(matrix, lengths)
+
+    def negate(self) -> Predicate:
+        return self.child
+
+    def satisfy(self, inp, offset=0):
+        child = self.child
+        if isinstance(child, Compound):
+            # De Morgan
+            dual = Or if isinstance(child, And) else And
+            negated = dual(
+                grandchild.negate() for grandchild in child.children
+            )
+            return negated.satisfy(inp, offset)
+        return child.negate().satisfy(inp, offset)
+
+    def expr(self) -> str:
+        return f"not ({self.child.expr()})"
+
+
+PREDICATE_KINDS = {
+    cls.kind: cls
+    for cls in (Length, Unary, InRange, OutRange, Binary, And, Or, Not)
+}
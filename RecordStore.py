@@ -0,0 +1,425 @@
+import json
+import os
+import pickle
+import random
+import struct
+import time
+
+import numpy as np
+
+from graph import Graph
+from MutationFuzzer import Seed
+
+# A log is a sequence of frames: a little-endian length followed by a
+# pickled list of entries
+_FRAME_HEADER = struct.Struct("<I")
+
+
+def _complete_frames_end(log_path) -> int:
+    # End of the last complete frame of a log, found from the headers only
+    size = os.path.getsize(log_path)
+    offset = 0
+    with open(log_path, "rb") as log_file:
+        while offset + _FRAME_HEADER.size <= size:
+            log_file.seek(offset)
+            (length,) = _FRAME_HEADER.unpack(log_file.read(_FRAME_HEADER.size))
+            if offset + _FRAME_HEADER.size + length > size:
+                break
+            offset += _FRAME_HEADER.size + length
+    return offset
+
+
+class RecordStore:
+    """Versioned on-disk store for a fuzzing campaign and its model.
+
+    The record and the population go to append-only logs, written while
+    fuzzing through `attach` and written in frames of up to `FRAME_SIZE`
+    entries. Graphs and the model's context map and edge conditions are
+    snapshots, replaced atomically on every save. Logs are read back one
+    frame at a time. A frame cut off by a crash is dropped when the store
+    is opened, so that new frames are appended after the complete ones.
+
+    `checkpoint` makes the stored campaign resumable with `resume`, which
+    continues it exactly as if it had not been interrupted. A checkpoint
+    only appends what changed since the previous one to the logs, plus
+    the executed inputs to `inputs.log`, and snapshots the small rest of
+    the fuzzer state. `checkpointed_runs` checkpoints while fuzzing.
+    """
+
+    VERSION = 2
+    FRAME_SIZE = 4096
+    LOGS = ("record.log", "seeds.log", "inputs.log")
+
+    def __init__(self, directory) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                version = json.load(meta_file)["version"]
+            if version > self.VERSION:
+                raise ValueError(
+                    f"Store version {version} is not supported "
+                    f"(expected {self.VERSION} or older)."
+                )
+        if not os.path.exists(meta_path) or version < self.VERSION:
+            # Older stores are read as is, and written in this version
+            with open(meta_path, "w") as meta_file:
+                json.dump({"version": self.VERSION}, meta_file)
+        self._path_ids = None
+        self._open_logs()
+        self._recorder = None
+        self._num_stored_seeds = 0
+        self._num_stored_inputs = 0
+        # Paths given inputs since the last checkpoint, and the execution
+        # counts of paths as of the last checkpoint
+        self._dirty_paths = set()
+        self._stored_counts = {}
+
+    def _open_logs(self) -> None:
+        for name in self.LOGS:
+            log_path = os.path.join(self.directory, name)
+            if os.path.exists(log_path):
+                end = _complete_frames_end(log_path)
+                if end < os.path.getsize(log_path):
+                    os.truncate(log_path, end)
+        self._record_log, self._seed_log, self._input_log = (
+            open(os.path.join(self.directory, name), "ab")
+            for name in self.LOGS
+        )
+        self._pending = {
+            self._record_log: [],
+            self._seed_log: [],
+            self._input_log: [],
+        }
+
+    def _append(self, log, entry) -> None:
+        self._pending[log].append(entry)
+        if len(self._pending[log]) >= self.FRAME_SIZE:
+            self._write_frame(log)
+
+    def _write_frame(self, log) -> None:
+        if len(self._pending[log]):
+            data = pickle.dumps(
+                self._pending[log], protocol=pickle.HIGHEST_PROTOCOL
+            )
+            log.write(_FRAME_HEADER.pack(len(data)))
+            log.write(data)
+            self._pending[log] = []
+
+    def _read_log(self, name, end=None):
+        # Entries of the frames in the first `end` bytes of the log, read
+        # one frame at a time
+        log_path = os.path.join(self.directory, name)
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, "rb") as log_file:
+            if end is None:
+                end = os.fstat(log_file.fileno()).st_size
+            offset = 0
+            while offset + _FRAME_HEADER.size <= end:
+                (size,) = _FRAME_HEADER.unpack(
+                    log_file.read(_FRAME_HEADER.size)
+                )
+                offset += _FRAME_HEADER.size
+                if offset + size > end:
+                    break
+                yield from pickle.loads(log_file.read(size))
+                offset += size
+
+    def _write_snapshot(self, name, data) -> None:
+        snapshot_path = os.path.join(self.directory, name)
+        with open(snapshot_path + ".tmp", "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+
+    def _read_snapshot(self, name):
+        snapshot_path = os.path.join(self.directory, name)
+        if not os.path.exists(snapshot_path):
+            return None
+        with open(snapshot_path, "rb") as f:
+            return pickle.load(f)
+
+    def _path_id(self, path) -> int:
+        if self._path_ids is None:
+            # Continue the path ids of a reopened store
+            self._path_ids = {
+                entry[2]: entry[1]
+                for entry in self._read_log("record.log")
+                if entry[0] == "path"
+            }
+        if path not in self._path_ids:
+            self._path_ids[path] = len(self._path_ids)
+            self._append(
+                self._record_log, ("path", self._path_ids[path], path)
+            )
+        return self._path_ids[path]
+
+    def add_input(self, path, inp) -> None:
+        self._append(self._record_log, ("input", self._path_id(path), inp))
+        self._dirty_paths.add(path)
+
+    def evict_input(self, path, inp) -> None:
+        self._append(self._record_log, ("evict", self._path_id(path), inp))
+        self._dirty_paths.add(path)
+
+    def add_seeds(self, seeds) -> None:
+        for seed in seeds:
+            self._append(self._seed_log, (seed.data, seed.coverage))
+
+    def attach(self, recorder) -> None:
+        # Log every recorded and evicted input; seeds are logged on `flush`.
+        # What the recorder found before and the store lacks is logged
+        # first, so a recorder restored from the store logs nothing again.
+        self.flush()
+        self._recorder = recorder
+        self._num_stored_seeds = sum(1 for _ in self._read_log("seeds.log"))
+        self._num_stored_inputs = sum(1 for _ in self._read_log("inputs.log"))
+        if recorder.cov_record:
+            paths, samples, _ = self._load_record_log()
+            stored = {
+                path: set(samples[path_id]) for path_id, path in paths.items()
+            }
+            for key, inputs in recorder.cov_record.items():
+                path = recorder.decode_path(key)
+                if stored.get(path) == inputs:
+                    continue
+                sample = recorder._samples.get(key)
+                if sample is None or len(sample) != len(inputs):
+                    sample = list(inputs)
+                self._append(
+                    self._record_log, ("sample", self._path_id(path), sample)
+                )
+        recorder.subscribe(self.add_input)
+        recorder.subscribe_evictions(self.evict_input)
+
+    def flush(self) -> None:
+        if self._recorder is not None:
+            population = self._recorder.population
+            self.add_seeds(population[self._num_stored_seeds :])
+            self._num_stored_seeds = len(population)
+        for log in self._pending:
+            self._write_frame(log)
+            log.flush()
+
+    def close(self) -> None:
+        self.flush()
+        for log in self._pending:
+            log.close()
+
+    def _load_record_log(self, end=None):
+        # (path id -> path, path id -> ordered inputs as dict keys,
+        # path id -> execution count)
+        paths, samples, counts = {}, {}, {}
+        for entry in self._read_log("record.log", end):
+            if entry[0] == "path":
+                _, path_id, path = entry
+                paths[path_id] = path
+                samples[path_id] = {}
+            elif entry[0] == "input":
+                _, path_id, inp = entry
+                samples[path_id][inp] = None
+            elif entry[0] == "evict":
+                _, path_id, inp = entry
+                samples[path_id].pop(inp, None)
+            elif entry[0] == "sample":
+                # The reservoir of a path at a checkpoint, in slot order
+                _, path_id, inputs = entry
+                samples[path_id] = dict.fromkeys(inputs)
+            else:
+                counts.update(entry[1])
+        return paths, samples, counts
+
+    def load_record(self):
+        paths, samples, _ = self._load_record_log()
+        return {path: set(samples[path_id]) for path_id, path in paths.items()}
+
+    def load_population(self, end=None):
+        population = []
+        for data, coverage in self._read_log("seeds.log", end):
+            seed = Seed(data)
+            seed.coverage = coverage
+            population.append(seed)
+        return population
+
+    def restore(self, recorder) -> None:
+        """Load the stored record and population into a fresh recorder."""
+        for path, inputs in self.load_record().items():
+            recorder.cov_record[recorder.encode_path(path)] = inputs
+        for seed in self.load_population():
+            recorder.population.append(seed)
+            recorder.coverages_seen.add(
+                recorder.encode_coverage(seed.coverage)
+            )
+        # Do not run the initial seeds again
+        recorder.seed_index = len(recorder.seeds)
+
+    def save_graphs(self, contcov_graph, coverage_graph) -> None:
+        self._write_snapshot(
+            "graphs.pickle",
+            (contcov_graph.to_adjacency(), coverage_graph.to_adjacency()),
+        )
+
+    def load_graphs(self):
+        adjacencies = self._read_snapshot("graphs.pickle")
+        if adjacencies is None:
+            return None
+        return tuple(map(Graph.from_adjacency, adjacencies))
+
+    def save_model(self, model) -> None:
+        self._write_snapshot(
+            "model.pickle",
+            {
+                "context_map": model.get_context_map(),
+                "edge_condition": model.get_edge_cond(),
+            },
+        )
+
+    def load_model(self, model) -> None:
+        state = self._read_snapshot("model.pickle")
+        if state is not None:
+            model.set_context_map(state["context_map"])
+            model.set_edge_cond(state["edge_condition"])
+
+    def checkpoint(self, model=None) -> None:
+        """Make the attached recorder's campaign resumable from here.
+
+        Appends the reservoirs of the paths given inputs and the execution
+        counts that changed since the last checkpoint, then flushes the
+        logs and snapshots the rest of the state: the RNGs, the schedule
+        and the pending candidates. A checkpoint costs time in the number
+        of recorded paths and new executions, not in the campaign size.
+        `model` is saved with `save_model` as well.
+        """
+        recorder = self._recorder
+        if self._path_ids is None:
+            self._path_ids = {
+                entry[2]: entry[1]
+                for entry in self._read_log("record.log")
+                if entry[0] == "path"
+            }
+        for path in self._dirty_paths:
+            key = recorder.encode_path(path)
+            samples = recorder._samples.get(key)
+            if samples is None or len(samples) != len(
+                recorder.cov_record[key]
+            ):
+                samples = list(recorder.cov_record[key])
+            self._append(
+                self._record_log, ("sample", self._path_ids[path], samples)
+            )
+        self._dirty_paths = set()
+        counts = {}
+        for key, count in recorder.path_counts.items():
+            if self._stored_counts.get(key) != count:
+                self._stored_counts[key] = count
+                path_id = self._path_ids[recorder.decode_path(key)]
+                counts[path_id] = count
+        if counts:
+            self._append(self._record_log, ("counts", counts))
+        for inp in recorder.inputs[self._num_stored_inputs :]:
+            self._append(self._input_log, inp)
+        self._num_stored_inputs = len(recorder.inputs)
+        self.flush()
+        schedule = dict(vars(recorder.schedule))
+        # The schedule's view of the population is restored on `resume`,
+        # and its coverage encoder is the recorder's
+        schedule.pop("_population", None)
+        schedule.pop("encode_coverage", None)
+        self._write_snapshot(
+            "checkpoint.pickle",
+            {
+                "logs": {
+                    name: os.path.getsize(os.path.join(self.directory, name))
+                    for name in self.LOGS
+                },
+                "random": random.getstate(),
+                "numpy_random": np.random.get_state(),
+                "seed_index": recorder.seed_index,
+                "candidates": recorder._candidates,
+                "chosen": [
+                    getattr(seed, "chosen", None)
+                    for seed in recorder.population
+                ],
+                "virgin_bits": recorder.virgin_bits,
+                "schedule": schedule,
+            },
+        )
+        if model is not None:
+            self.save_model(model)
+
+    def resume(self, recorder, model=None) -> bool:
+        """Restore the last checkpoint into a fresh recorder and attach it.
+
+        The recorder must be built like the checkpointed one, and is then
+        in the same state, RNGs included, so fuzzing on gives the results
+        of the uninterrupted campaign. Whatever was logged after the
+        checkpoint is dropped. `model` is restored with `load_model`.
+        Returns False, attaching nothing, if there is no checkpoint.
+        """
+        state = self._read_snapshot("checkpoint.pickle")
+        if state is None:
+            return False
+        ends = state["logs"]
+        # Drop what a crashed run logged after the checkpoint
+        self.close()
+        for name, end in ends.items():
+            with open(os.path.join(self.directory, name), "ab") as log:
+                log.truncate(end)
+        self._open_logs()
+        self._path_ids = None
+
+        paths, samples, counts = self._load_record_log(ends["record.log"])
+        self._stored_counts = {}
+        for path_id, path in paths.items():
+            key = recorder.encode_path(path)
+            recorder.cov_record[key] = set(samples[path_id])
+            recorder._samples[key] = list(samples[path_id])
+            if path_id in counts:
+                recorder.path_counts[key] = counts[path_id]
+                self._stored_counts[key] = counts[path_id]
+        for seed in self.load_population(ends["seeds.log"]):
+            recorder.population.append(seed)
+            recorder.coverages_seen.add(
+                recorder.encode_coverage(seed.coverage)
+            )
+        for seed, chosen in zip(recorder.population, state["chosen"]):
+            if chosen is not None:
+                seed.chosen = chosen
+        recorder.inputs = list(
+            self._read_log("inputs.log", ends["inputs.log"])
+        )
+        recorder.seed_index = state["seed_index"]
+        recorder._candidates = state["candidates"]
+        recorder.virgin_bits = state["virgin_bits"]
+        vars(recorder.schedule).update(state["schedule"])
+        if "_population" in vars(recorder.schedule):
+            recorder.schedule._population = recorder.population
+        random.setstate(state["random"])
+        np.random.set_state(state["numpy_random"])
+        self.attach(recorder)
+        if model is not None:
+            self.load_model(model)
+        return True
+
+    def checkpointed_runs(
+        self, runner, trials=10, every=None, interval=None, model=None
+    ):
+        """`runs` of the attached recorder with checkpoints.
+
+        Checkpoints after every `every` executions, at most `interval`
+        seconds apart, and at the end.
+        """
+        recorder = self._recorder
+        results = []
+        last_checkpoint = time.monotonic()
+        for trial in range(1, trials + 1):
+            results.append(recorder.run(runner))
+            if (every is not None and trial % every == 0) or (
+                interval is not None
+                and time.monotonic() - last_checkpoint >= interval
+            ):
+                self.checkpoint(model)
+                last_checkpoint = time.monotonic()
+        self.checkpoint(model)
+        return results
@@ -0,0 +1,133 @@
+import json
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class Stats:
+    """Counters and timers for a fuzzing and modeling run.
+
+    `count` adds to a counter, or to the counter of `key` (an input index,
+    an edge) under a name. `timer` times a block; timed blocks are also
+    kept as events for `chrome_trace`. With `status_interval`, `tick`
+    prints a status line to `file` at most every `status_interval`
+    seconds.
+
+    Instrumented classes hold `NULL_STATS` unless given a `Stats`, and
+    check `enabled` before computing anything for it.
+    """
+
+    enabled = True
+
+    def __init__(self, status_interval=None, file=sys.stderr) -> None:
+        self.status_interval = status_interval
+        self.file = file
+        self.counters = {}
+        self.keyed_counters = {}
+        # name -> [total seconds, number of timed blocks]
+        self.timers = {}
+        # (name, start, seconds, thread id)
+        self.events = []
+        self._start = time.perf_counter()
+        self._last_status = self._start
+
+    def count(self, name, n=1, key=None) -> None:
+        if key is None:
+            self.counters[name] = self.counters.get(name, 0) + n
+        else:
+            counters = self.keyed_counters.setdefault(name, {})
+            counters[key] = counters.get(key, 0) + n
+
+    def add_time(self, name, seconds, start=None, tid=0) -> None:
+        timer = self.timers.setdefault(name, [0.0, 0])
+        timer[0] += seconds
+        timer[1] += 1
+        if start is None:
+            start = time.perf_counter() - seconds
+        self.events.append((name, start, seconds, tid))
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, start)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def tick(self) -> None:
+        if self.status_interval is None:
+            return
+        now = time.perf_counter()
+        if now - self._last_status >= self.status_interval:
+            self._last_status = now
+            print(self.status_line(), file=self.file, flush=True)
+
+    def status_line(self) -> str:
+        elapsed = self.elapsed()
+        executions = self.counters.get("executions", 0)
+        fields = [f"{elapsed:.1f}s", f"execs/s={executions / elapsed:.0f}"]
+        fields += [f"{name}={n}" for name, n in sorted(self.counters.items())]
+        return "[stats] " + " ".join(fields)
+
+    def to_dict(self):
+        return {
+            "elapsed_sec": self.elapsed(),
+            "counters": dict(self.counters),
+            "keyed_counters": {
+                name: {str(key): n for key, n in counters.items()}
+                for name, counters in self.keyed_counters.items()
+            },
+            "timers": {
+                name: {"total_sec": seconds, "calls": calls}
+                for name, (seconds, calls) in self.timers.items()
+            },
+        }
+
+    def chrome_trace(self):
+        """The timed blocks in Chrome's trace event format."""
+        return {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": (start - self._start) * 1e6,
+                    "dur": seconds * 1e6,
+                    "pid": 0,
+                    "tid": tid,
+                }
+                for name, start, seconds, tid in self.events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def dump_json(self, path) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def dump_chrome_trace(self, path) -> None:
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class NullStats(Stats):
+    """`Stats` that records nothing."""
+
+    enabled = False
+
+    def count(self, name, n=1, key=None) -> None:
+        pass
+
+    def add_time(self, name, seconds, start=None, tid=0) -> None:
+        pass
+
+    def timer(self, name):
+        return nullcontext()
+
+    def tick(self) -> None:
+        pass
+
+
+NULL_STATS = NullStats()
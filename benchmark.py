@@ -0,0 +1,168 @@
+"""Benchmarks for fuzzing throughput and the model-building stages.
+
+Runs the `example/python` targets and prints one JSON document with
+executions per second for each runner type, and for each campaign size the
+time to fuzz, build both graphs, `model_context` and `model_condition`
+(with peak traced memory when `--memory` is given).
+
+    python benchmark.py --sizes 1000 10000 --output bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from ControlFlowModel import ControlFlowModel
+from Coverage import (
+    HAS_MONITORING,
+    FunctionBitmapRunner,
+    FunctionContCovRunner,
+    FunctionCoverageRunner,
+    InternedContCovRunner,
+    MonitoringContCov,
+    MonitoringCoverage,
+)
+from example.python.count import count_tup
+from example.python.crash import crashme3_tup, crashme_tup
+from example.python.triangle import triangle3_tup
+from Fuzzer import FunctionRunner
+from graph import Graph
+from GreyboxFuzzer import GreyboxFuzzerRecorder
+from MutationFuzzer import MutationFuzzer, Mutator, PowerSchedule
+
+TARGETS = {
+    "crashme": crashme_tup,
+    "crashme3": crashme3_tup,
+    "triangle3": triangle3_tup,
+    "count": count_tup,
+}
+
+RUNNERS = {
+    "function": FunctionRunner,
+    "coverage": FunctionCoverageRunner,
+    "bitmap": FunctionBitmapRunner,
+    "contcov": FunctionContCovRunner,
+    "interned-contcov": InternedContCovRunner,
+}
+if HAS_MONITORING:
+    RUNNERS["monitoring-coverage"] = lambda function: FunctionCoverageRunner(
+        function, tracer=MonitoringCoverage
+    )
+    RUNNERS["monitoring-contcov"] = lambda function: FunctionContCovRunner(
+        function, tracer=MonitoringContCov
+    )
+
+
+class Stage:
+    """Times a block, and traces its peak memory if `memory` is set."""
+
+    def __init__(self, result, name, memory=False) -> None:
+        self.result = result
+        self.name = name
+        self.memory = memory
+
+    def __enter__(self):
+        if self.memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.result[f"{self.name}_sec"] = time.perf_counter() - self.start
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.result[f"{self.name}_peak_bytes"] = peak
+
+
+def bench_runners(trials):
+    results = {}
+    for target, (program, seed_input_list) in TARGETS.items():
+        results[target] = {}
+        for name, runner_class in RUNNERS.items():
+            random.seed(0)
+            fuzzer = MutationFuzzer(
+                seed_input_list, Mutator(), PowerSchedule()
+            )
+            inputs = [fuzzer.fuzz() for _ in range(trials)]
+            runner = runner_class(program)
+            start = time.perf_counter()
+            for inp in inputs:
+                runner.run(inp)
+            results[target][name] = trials / (time.perf_counter() - start)
+    return results
+
+
+def bench_pipeline(target, trials, mut_trial, max_trial, memory):
+    program, seed_input_list = TARGETS[target]
+    random.seed(0)
+    np.random.seed(0)
+    result = {"target": target, "trials": trials}
+    recorder = GreyboxFuzzerRecorder(
+        seed_input_list, Mutator(), PowerSchedule()
+    )
+    runner = FunctionContCovRunner(program)
+    with Stage(result, "fuzz"):
+        recorder.runs(runner, trials=trials)
+    result["fuzz_execs_per_sec"] = trials / result["fuzz_sec"]
+    record = recorder.get_record()
+    result["paths"] = len(record)
+
+    contcov_graph, coverage_graph = Graph(), Graph()
+    with Stage(result, "graph", memory):
+        for path in record:
+            contcov_graph.accept(path)
+            coverage_graph.accept([contcov[1] for contcov in path])
+    result["nodes"] = len(contcov_graph.nodes)
+
+    model = ControlFlowModel(record, contcov_graph, coverage_graph, runner)
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.identify_branch()
+        with Stage(result, "model_context", memory):
+            model.model_context(mut_trial=mut_trial)
+        with Stage(result, "model_condition", memory):
+            model.model_condition(max_trial=max_trial)
+    result["branches"] = len(model._bnodes)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 5000])
+    parser.add_argument("--runner-trials", type=int, default=5000)
+    parser.add_argument("--mut-trial", type=int, default=10)
+    parser.add_argument("--max-trial", type=int, default=50)
+    parser.add_argument("--memory", action="store_true")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = {
+        "python": platform.python_version(),
+        "runner_execs_per_sec": bench_runners(args.runner_trials),
+        "pipeline": [
+            bench_pipeline(
+                target, trials, args.mut_trial, args.max_trial, args.memory
+            )
+            for target in args.targets
+            for trials in args.sizes
+        ],
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
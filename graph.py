@@ -3,18 +3,19 @@ from typing import List
 
 
 class Node:
+    __slots__ = ("label", "_childs", "_child_index")
+
     def __init__(self, label) -> None:
         self.label = label
         self._childs = []
+        self._child_index = {}
 
     def add_child(self, child_node) -> None:
         self._childs.append(child_node)
+        self._child_index.setdefault(child_node.label, child_node)
 
     def get_child(self, label):
-        for child in self._childs:
-            if child.label == label:
-                return child
-        return None
+        return self._child_index.get(label)
 
     def num_child(self):
         return len(self._childs)
@@ -36,6 +37,12 @@ class Edge:
     def __hash__(self) -> int:
         return hash((self.src, self.dest))
 
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Edge) and (self.src, self.dest) == (
+            other.src,
+            other.dest,
+        )
+
     def __str__(self) -> str:
         return f"E<{self.src} -> {self.dest}>"
 
@@ -44,22 +51,19 @@ class Graph:
     def __init__(self) -> None:
         self.root = Node("ENTRY")
         self.nodes: List[Node] = [self.root]
+        self._node_index = {self.root.label: self.root}
 
     def find_node(self, label) -> Node:
-        node_of_label = [node for node in self.nodes if node.label == label]
-        if len(node_of_label):
-            return node_of_label[0]
-        else:
-            return None
+        return self._node_index.get(label)
 
     def add_node(self, label, parent: Node) -> Node:
-        node_of_label = [node for node in self.nodes if node.label == label]
-        if len(node_of_label):
+        if label in self._node_index:
             print(f"Node of label {label} already exists. PASS.")
             return None
         else:
             new_node = Node(label)
             self.nodes.append(new_node)
+            self._node_index[label] = new_node
             parent.add_child(new_node)
             return new_node
 
@@ -77,6 +81,25 @@ class Graph:
     def get_tree(self):
         return self.root
 
+    def to_adjacency(self):
+        return [
+            (node.label, [child.label for child in node])
+            for node in self.nodes
+        ]
+
+    @classmethod
+    def from_adjacency(cls, adjacency):
+        graph = cls()
+        for label, _ in adjacency[1:]:
+            node = Node(label)
+            graph.nodes.append(node)
+            graph._node_index[label] = node
+        for label, child_labels in adjacency:
+            node = graph.find_node(label)
+            for child_label in child_labels:
+                node.add_child(graph.find_node(child_label))
+        return graph
+
     def print_tree(self):
         traversed_nodes = set()
         queue = [self.root]
@@ -112,3 +135,32 @@ class Graph:
 
     def __iter__(self):
         return iter(self.nodes)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    # Random walks over a label space that grows with the number of paths,
+    # each label having a few successors like a real control-flow graph
+    for n in [1000, 10000, 100000]:
+        random.seed(0)
+        num_labels = n // 10
+        paths = []
+        for _ in range(n):
+            label = random.randrange(num_labels)
+            path = []
+            for _ in range(random.randint(5, 30)):
+                path.append(("f", label))
+                label = (label * 7 + random.randrange(3)) % num_labels
+            paths.append(tuple(path))
+        graph = Graph()
+        start = time.time()
+        for path in paths:
+            graph.accept(path)
+        end = time.time()
+        num_elems = sum(len(path) for path in paths)
+        print(
+            f"Building a graph of {len(graph.nodes)} nodes from {n} paths took {end - start:.2f} seconds "
+            f"({(end - start) / num_elems * 1e6:.2f} us per path element)."
+        )
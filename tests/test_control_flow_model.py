@@ -0,0 +1,105 @@
+import random
+
+import numpy as np
+import pytest
+
+from ControlFlowModel import ControlFlowModel
+from Coverage import FunctionContCovRunner
+from graph import Graph
+
+
+@pytest.mark.parametrize(
+    "confidence, min_effect, name",
+    [
+        (0, 0.2, "confidence"),
+        (1.0, 0.2, "confidence"),
+        (1.5, 0.2, "confidence"),
+        (0.95, 0, "min_effect"),
+        (0.95, 1.0, "min_effect"),
+    ],
+)
+def test_model_context_rejects_invalid_bounds(confidence, min_effect, name):
+    model = ControlFlowModel({}, None, None, None)
+    with pytest.raises(ValueError, match=name):
+        model.model_context(confidence=confidence, min_effect=min_effect)
+
+
+def make_graphs(paths):
+    contcov_graph, coverage_graph = Graph(), Graph()
+    for path in paths:
+        contcov_graph.accept(path)
+        coverage_graph.accept([contcov[1] for contcov in path])
+    return contcov_graph, coverage_graph
+
+
+PATHS = [
+    (("", ("f", 1)), ("", ("f", 2))),
+    (("", ("f", 1)), ("", ("f", 3))),
+]
+
+
+def test_context_nodes_follow_replaced_graphs():
+    model = ControlFlowModel(
+        dict.fromkeys(PATHS, {"a"}), *make_graphs(PATHS), None
+    )
+    model.identify_branch()
+    (bnode,) = model.branch_nodes()
+    assert model.get_context_nodes(bnode)
+
+    contcov_graph, coverage_graph = make_graphs(PATHS)
+    model.set_graphs(contcov_graph, coverage_graph)
+    model.identify_branch()
+    (bnode,) = model.branch_nodes()
+    assert model.get_context_nodes(bnode) == {
+        contcov_graph.find_node(("", ("f", 1)))
+    }
+
+
+def test_identify_branch_reindexes_context_nodes():
+    contcov_graph, coverage_graph = make_graphs(PATHS)
+    model = ControlFlowModel(
+        dict.fromkeys(PATHS, {"a"}), contcov_graph, coverage_graph, None
+    )
+    model.identify_branch()
+    (bnode,) = model.branch_nodes()
+    assert len(model.get_context_nodes(bnode)) == 1
+
+    contcov_graph.accept([("g", ("f", 1)), ("g", ("f", 2))])
+    model.identify_branch()
+    (bnode,) = model.branch_nodes()
+    assert model.get_context_nodes(bnode) == {
+        contcov_graph.find_node(("", ("f", 1))),
+        contcov_graph.find_node(("g", ("f", 1))),
+    }
+
+
+def check(s):
+    # s[1] of "gA" changes the branch in about a quarter of its mutants
+    if s[0] == "g" and s[1] <= "f":
+        return 1
+    return 0
+
+
+def call_check(s):
+    return check(s)
+
+
+def context_ranges(**bounds):
+    runner = FunctionContCovRunner(call_check)
+    record = {}
+    for inp in ["gA", "gz"]:
+        runner.run(inp)
+        record[tuple(runner.trace())] = {inp}
+    model = ControlFlowModel(record, *make_graphs(record), runner)
+    model.identify_branch()
+    random.seed(0)
+    np.random.seed(0)
+    model.model_context(mut_trial=50, confidence=0.95, **bounds)
+    return list(model.get_context_map().values())
+
+
+def test_min_effect_drops_weak_indices():
+    # At the default min_effect, s[1] is probed long enough to be found
+    assert context_ranges() == [range(0, 2)]
+    # At 0.9, two mutants that keep the branch settle s[1] as inessential
+    assert context_ranges(min_effect=0.9) == [range(0, 1)]
@@ -0,0 +1,125 @@
+import sys
+
+import numpy as np
+import pytest
+
+from Coverage import (
+    HAS_MONITORING,
+    MONITORING_TOOL_IDS,
+    ContCov,
+    Coverage,
+    FunctionBitmapRunner,
+    FunctionContCovRunner,
+    FunctionCoverageRunner,
+    MonitoringContCov,
+    MonitoringCoverage,
+)
+from example.python.count import count
+from example.python.crash import crashme3_tup
+from example.python.triangle import triangle3_tup
+
+needs_monitoring = pytest.mark.skipif(
+    not HAS_MONITORING, reason="sys.monitoring requires Python 3.12+"
+)
+
+
+def one_line_loop(s):
+    n = 0
+    while n < len(s): n += 1  # fmt: skip
+    return sum(1 for c in s if c.isdigit())
+
+
+CASES = [
+    (crashme3_tup[0], crashme3_tup[1] + ["", "100ba", "0"]),
+    (triangle3_tup[0], triangle3_tup[1] + ["x", "000000000000"]),
+    (count, ["hello 456", "", "A" * 20]),
+    (one_line_loop, ["", "a1b2"]),
+]
+
+
+@needs_monitoring
+@pytest.mark.parametrize(
+    "runner_class, tracer, monitoring_tracer",
+    [
+        (FunctionCoverageRunner, Coverage, MonitoringCoverage),
+        (FunctionContCovRunner, ContCov, MonitoringContCov),
+    ],
+)
+def test_monitoring_traces_equal_settrace(
+    runner_class, tracer, monitoring_tracer
+):
+    for function, inputs in CASES:
+        runner = runner_class(function, tracer=tracer)
+        monitoring_runner = runner_class(function, tracer=monitoring_tracer)
+        for inp in inputs:
+            assert monitoring_runner.run(inp) == runner.run(inp)
+            assert monitoring_runner.trace() == runner.trace()
+            assert monitoring_runner.coverage() == runner.coverage()
+
+
+@needs_monitoring
+def test_first_hit_only_keeps_first_hit_order():
+    for function, inputs in CASES:
+        runner = FunctionCoverageRunner(function)
+        monitoring_runner = FunctionCoverageRunner(
+            function, tracer=lambda: MonitoringCoverage(first_hit_only=True)
+        )
+        for inp in inputs:
+            runner.run(inp)
+            monitoring_runner.run(inp)
+            assert monitoring_runner.trace() == list(
+                dict.fromkeys(runner.trace())
+            )
+
+
+@needs_monitoring
+@pytest.mark.parametrize(
+    "tracer, monitoring_tracer",
+    [(Coverage, MonitoringCoverage), (ContCov, MonitoringContCov)],
+)
+def test_empty_block(tracer, monitoring_tracer):
+    with tracer() as cov:
+        pass
+    with monitoring_tracer() as monitoring_cov:
+        pass
+    assert monitoring_cov.trace() == cov.trace()
+
+
+@needs_monitoring
+def test_monitoring_takes_a_free_tool_id():
+    # As under coverage.py, and with the first free id taken as well
+    held = [
+        tool_id
+        for tool_id in (sys.monitoring.COVERAGE_ID, MONITORING_TOOL_IDS[0])
+        if sys.monitoring.get_tool(tool_id) is None
+    ]
+    for tool_id in held:
+        sys.monitoring.use_tool_id(tool_id, "test")
+    try:
+        function, inputs = CASES[0]
+        runner = FunctionCoverageRunner(function)
+        monitoring_runner = FunctionCoverageRunner(
+            function, tracer=MonitoringCoverage
+        )
+        for inp in inputs:
+            runner.run(inp)
+            monitoring_runner.run(inp)
+            assert monitoring_runner.trace() == runner.trace()
+        assert sys.monitoring.get_tool(MONITORING_TOOL_IDS[1]) is None
+    finally:
+        for tool_id in held:
+            sys.monitoring.free_tool_id(tool_id)
+
+
+def test_bitmap_runner_reuses_a_cleared_map():
+    function, inputs = CASES[0]
+    runner = FunctionBitmapRunner(function)
+    runner.run(inputs[0])
+    first_bits = runner.trace_bits()
+    for inp in inputs:
+        runner.run(inp)
+        fresh_runner = FunctionBitmapRunner(function)
+        fresh_runner.run(inp)
+        assert np.shares_memory(runner.trace_bits(), first_bits)
+        assert (runner.trace_bits() == fresh_runner.trace_bits()).all()
+        assert (runner.edges() == fresh_runner.edges()).all()
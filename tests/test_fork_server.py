@@ -0,0 +1,78 @@
+import os
+import pickle
+import time
+
+import pytest
+
+from Coverage import FunctionCoverageRunner
+from ForkServer import ForkServerRunner
+from Fuzzer import Runner
+
+
+def target(s):
+    if s.startswith("exit"):
+        os._exit(int(s[4:]))
+    if s == "hang":
+        time.sleep(10)
+    if s == "big":
+        for _ in range(2000):
+            pass
+    if s == "raise":
+        raise ValueError(s)
+    return len(s)
+
+
+@pytest.fixture
+def make_runner():
+    runners = []
+
+    def make(**kwargs):
+        runners.append(
+            ForkServerRunner(FunctionCoverageRunner(target), **kwargs)
+        )
+        return runners[-1]
+
+    yield make
+    for runner in runners:
+        runner.close()
+
+
+def expected(inp):
+    runner = FunctionCoverageRunner(target)
+    result, outcome = runner.run(inp)
+    return result, outcome, runner.trace(), runner.coverage()
+
+
+@pytest.mark.parametrize("code", [0, 1, 3])
+def test_exit_codes_are_the_target_s(make_runner, code):
+    runner = make_runner(batch_size=4)
+    inps = ["ab", f"exit{code}", "abc"]
+    results = runner.run_batch(inps)
+    assert results[0] == expected("ab")
+    assert results[1] == (None, Runner.FAIL, [], set())
+    assert results[2] == expected("abc")
+
+
+def test_exceptions_and_timeouts(make_runner):
+    runner = make_runner(timeout=0.2, batch_size=4)
+    assert runner.run("raise") == (None, Runner.FAIL)
+    assert runner.run_batch(["hang", "a"]) == [
+        (None, Runner.UNRESOLVED, [], set()),
+        expected("a"),
+    ]
+    assert runner.run("a") == (1, Runner.PASS)
+    assert runner.trace() == expected("a")[2]
+
+
+def test_overflow_keeps_finished_results(make_runner):
+    inps = ["a", "bb", "big", "ccc", "big"]
+    # Room for each result on its own, but not for both big ones
+    buffer_size = 3 * len(pickle.dumps(expected("big"))) // 2
+    runner = make_runner(batch_size=len(inps), buffer_size=buffer_size)
+    assert runner.run_batch(inps) == [expected(inp) for inp in inps]
+
+
+def test_overflow_of_a_single_result_raises(make_runner):
+    runner = make_runner(buffer_size=64)
+    with pytest.raises(RuntimeError, match="buffer_size"):
+        runner.run("big")
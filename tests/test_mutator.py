@@ -0,0 +1,21 @@
+import numpy as np
+
+from MutationFuzzer import HavocMutator
+
+SEED = "abcdefghijklmnopqrstuvwxyz0123456789"
+
+
+def distance(mutant):
+    # Changed positions, a rough count of the stacked mutations
+    return sum(a != b for a, b in zip(mutant, SEED)) + abs(
+        len(mutant) - len(SEED)
+    )
+
+
+def test_havoc_mutants_are_not_ordered_by_depth():
+    np.random.seed(0)
+    mutants = HavocMutator().havoc(SEED, 2000)
+    assert len(mutants) == 2000
+    distances = [distance(mutant) for mutant in mutants]
+    first, second = np.mean(distances[:1000]), np.mean(distances[1000:])
+    assert abs(first - second) < 0.1 * (first + second) / 2
@@ -0,0 +1,32 @@
+from Coverage import FunctionContCovRunner
+from example.python.crash import crashme3_tup
+from GreyboxFuzzer import GreyboxFuzzerRecorder
+from MutationFuzzer import Mutator, PowerSchedule
+from ParallelFuzzer import ParallelFuzzerRecorder
+
+PROGRAM, SEEDS = crashme3_tup
+
+
+def test_seeds_run_once():
+    fuzzer = GreyboxFuzzerRecorder(SEEDS, Mutator(), PowerSchedule())
+    parallel_fuzzer = ParallelFuzzerRecorder(
+        fuzzer, workers=2, sync_interval=50
+    )
+    results = parallel_fuzzer.runs(FunctionContCovRunner(PROGRAM), 200)
+    assert len(results) == len(parallel_fuzzer.inputs) == 200
+    assert parallel_fuzzer.inputs[: len(SEEDS)] == SEEDS
+    # Workers seed their RNGs, so their inputs are reproducible
+    assert not set(SEEDS) & set(parallel_fuzzer.inputs[len(SEEDS) :])
+
+    # Laid out as the serial population: the seeds, then the seeds found
+    serial = GreyboxFuzzerRecorder(SEEDS, Mutator(), PowerSchedule())
+    serial.runs(FunctionContCovRunner(PROGRAM), len(SEEDS))
+    population = parallel_fuzzer.population
+    assert [seed.data for seed in population[: len(serial.population)]] == [
+        seed.data for seed in serial.population
+    ]
+    assert all(hasattr(seed, "coverage") for seed in population[len(SEEDS) :])
+
+    results = parallel_fuzzer.runs(FunctionContCovRunner(PROGRAM), 100)
+    assert len(results) == 100
+    assert len(parallel_fuzzer.inputs) == 300
@@ -0,0 +1,156 @@
+import os
+import random
+
+from Coverage import FunctionContCovRunner
+from example.python.crash import crashme3_tup
+from GreyboxFuzzer import GreyboxFuzzerRecorder
+from MutationFuzzer import Mutator, PowerSchedule, Seed
+from RecordStore import RecordStore
+
+PROGRAM, SEEDS = crashme3_tup
+
+PATH = (("", ("f", 1)), ("", ("f", 2)))
+OTHER_PATH = (("", ("f", 1)), ("", ("f", 3)))
+
+
+def test_record_and_population_round_trip(tmp_path):
+    store = RecordStore(tmp_path)
+    store.add_input(PATH, "a")
+    store.add_input(PATH, "b")
+    store.add_input(OTHER_PATH, "c")
+    seed = Seed("a")
+    seed.coverage = set(PATH)
+    store.add_seeds([seed])
+    store.close()
+
+    store = RecordStore(tmp_path)
+    assert store.load_record() == {PATH: {"a", "b"}, OTHER_PATH: {"c"}}
+    (loaded,) = store.load_population()
+    assert (loaded.data, loaded.coverage) == ("a", set(PATH))
+    store.close()
+
+
+def test_torn_frame_is_dropped_on_open(tmp_path):
+    store = RecordStore(tmp_path)
+    store.add_input(PATH, "a")
+    store.flush()
+    store.add_input(PATH, "b")
+    store.close()
+    # A crash while writing the second frame
+    log_path = os.path.join(tmp_path, "record.log")
+    os.truncate(log_path, os.path.getsize(log_path) - 3)
+
+    store = RecordStore(tmp_path)
+    assert store.load_record() == {PATH: {"a"}}
+    store.add_input(OTHER_PATH, "c")
+    store.close()
+
+    store = RecordStore(tmp_path)
+    assert store.load_record() == {PATH: {"a"}, OTHER_PATH: {"c"}}
+    store.close()
+
+
+def test_torn_frame_header_is_dropped_on_open(tmp_path):
+    store = RecordStore(tmp_path)
+    store.add_input(PATH, "a")
+    store.close()
+    with open(os.path.join(tmp_path, "record.log"), "ab") as log:
+        log.write(b"\x10\x00")
+
+    store = RecordStore(tmp_path)
+    store.add_input(PATH, "b")
+    store.close()
+    assert RecordStore(tmp_path).load_record() == {PATH: {"a", "b"}}
+
+
+def test_evicted_inputs_are_not_loaded(tmp_path):
+    store = RecordStore(tmp_path)
+    store.add_input(PATH, "a")
+    store.add_input(PATH, "b")
+    store.evict_input(PATH, "a")
+    store.add_input(PATH, "c")
+    store.close()
+    assert RecordStore(tmp_path).load_record() == {PATH: {"b", "c"}}
+
+
+def test_stored_record_keeps_max_inputs(tmp_path):
+    random.seed(0)
+    recorder = GreyboxFuzzerRecorder(
+        SEEDS, Mutator(), PowerSchedule(), max_inputs=2
+    )
+    store = RecordStore(tmp_path)
+    store.attach(recorder)
+    recorder.runs(FunctionContCovRunner(PROGRAM), trials=500)
+    store.close()
+
+    record = RecordStore(tmp_path).load_record()
+    assert record == recorder.get_record()
+    assert max(map(len, record.values())) == 2
+
+
+def campaign_state(recorder):
+    return (
+        dict(recorder.get_record()),
+        [seed.data for seed in recorder.population],
+        recorder.inputs,
+        {
+            recorder.decode_path(key): count
+            for key, count in recorder.path_counts.items()
+        },
+    )
+
+
+def uninterrupted_campaign(trials):
+    random.seed(0)
+    recorder = GreyboxFuzzerRecorder(SEEDS, Mutator(), PowerSchedule())
+    recorder.runs(FunctionContCovRunner(PROGRAM), trials=trials)
+    return campaign_state(recorder)
+
+
+def test_resume_continues_the_campaign(tmp_path):
+    runner = FunctionContCovRunner(PROGRAM)
+    random.seed(0)
+    recorder = GreyboxFuzzerRecorder(SEEDS, Mutator(), PowerSchedule())
+    store = RecordStore(tmp_path)
+    store.attach(recorder)
+    store.checkpointed_runs(runner, trials=300, every=100)
+    # Work lost by a crash after the checkpoint
+    recorder.runs(runner, trials=50)
+    store.close()
+
+    random.seed(1)
+    recorder = GreyboxFuzzerRecorder(SEEDS, Mutator(), PowerSchedule())
+    store = RecordStore(tmp_path)
+    assert store.resume(recorder)
+    store.checkpointed_runs(runner, trials=300)
+    store.close()
+    assert campaign_state(recorder) == uninterrupted_campaign(600)
+
+    recorder = GreyboxFuzzerRecorder(SEEDS, Mutator(), PowerSchedule())
+    assert RecordStore(tmp_path).resume(recorder)
+    assert campaign_state(recorder) == uninterrupted_campaign(600)
+
+
+def test_attach_logs_what_was_recorded_before(tmp_path):
+    runner = FunctionContCovRunner(PROGRAM)
+    random.seed(0)
+    recorder = GreyboxFuzzerRecorder(SEEDS, Mutator(), PowerSchedule())
+    recorder.runs(runner, trials=300)
+    store = RecordStore(tmp_path)
+    store.attach(recorder)
+    store.checkpointed_runs(runner, trials=300)
+    store.close()
+    assert campaign_state(recorder) == uninterrupted_campaign(600)
+
+    recorder = GreyboxFuzzerRecorder(SEEDS, Mutator(), PowerSchedule())
+    assert RecordStore(tmp_path).resume(recorder)
+    assert campaign_state(recorder) == uninterrupted_campaign(600)
+
+
+def test_resume_without_checkpoint(tmp_path):
+    store = RecordStore(tmp_path)
+    store.add_input(PATH, "a")
+    store.close()
+    recorder = GreyboxFuzzerRecorder(SEEDS, Mutator(), PowerSchedule())
+    assert not RecordStore(tmp_path).resume(recorder)
+    assert recorder.get_record() == {}
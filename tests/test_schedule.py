@@ -0,0 +1,75 @@
+import random
+from itertools import accumulate
+
+from MutationFuzzer import AFLFastSchedule, FenwickTree, Seed
+
+
+def naive_find(weights, value):
+    for index, prefix in enumerate(accumulate(weights)):
+        if prefix > value:
+            return index
+    return len(weights) - 1
+
+
+def test_fenwick_tree_matches_naive_prefix_sums():
+    rng = random.Random(0)
+    weights = []
+    tree = FenwickTree()
+    for _ in range(300):
+        if weights and rng.random() < 0.6:
+            index = rng.randrange(len(weights))
+            weights[index] = float(rng.randrange(10))
+            tree.update(index, weights[index])
+        else:
+            weights.append(float(rng.randrange(10)))
+            tree.append(weights[-1])
+        assert tree.weights == weights
+        assert tree.total() == sum(weights)
+        for value in range(int(sum(weights))):
+            assert tree.find(value) == naive_find(weights, value)
+
+
+def test_fenwick_tree_skips_zero_weights():
+    tree = FenwickTree([0.0, 2.0, 0.0, 0.0, 1.0, 0.0])
+    found = {tree.find(value / 10) for value in range(30)}
+    assert found == {1, 4}
+
+
+def make_population(coverages):
+    population = []
+    for coverage in coverages:
+        seed = Seed("".join(coverage))
+        seed.coverage = set(coverage)
+        population.append(seed)
+    return population
+
+
+def test_afl_fast_energies_match_formula():
+    for schedule, energy in [
+        ("exp", lambda f, s: min(2.0**s / max(f, 1), 2**16)),
+        ("freq", lambda f, s: 1.0 / max(f, 1) ** 5),
+    ]:
+        random.seed(0)
+        aflfast = AFLFastSchedule(schedule)
+        population = make_population(["a", "b", "ab"])
+        for coverage in ["a", "a", "a", "b", "ab", "ab"]:
+            aflfast.observe(population, frozenset(coverage))
+        for _ in range(20):
+            aflfast.choose(population)
+            population += make_population(["c"] * (len(population) < 5))
+            aflfast.assign_energy(population)
+            for seed in population:
+                frequency = aflfast.path_frequency.get(
+                    frozenset(seed.coverage), 0
+                )
+                assert seed.energy == energy(frequency, seed.chosen)
+
+
+def test_afl_fast_prefers_rare_paths():
+    random.seed(0)
+    aflfast = AFLFastSchedule("freq")
+    population = make_population(["a", "b"])
+    for _ in range(9):
+        aflfast.observe(population, frozenset("a"))
+    chosen = [aflfast.choose(population).data for _ in range(200)]
+    assert chosen.count("b") > 190